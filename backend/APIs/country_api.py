@@ -1,18 +1,36 @@
 from flask import Blueprint, jsonify, request
 import os
-import json
-from collections import defaultdict
-import reverse_geocoder as rg
+from APIs.globe_api import DATASETS
+from us_ghg_center.plot3d_v1 import MAX_WORKERS
+from us_ghg_center.country_totals import country_totals_path, is_current, precompute_country_totals
+from APIs.response_cache import RESPONSE_CACHE
+from APIs.readiness import READINESS, not_ready_response
+from APIs.single_flight import SINGLE_FLIGHT
 
 country_api = Blueprint('country_api', __name__)
 
-JSON_FOLDER_NATURAL = "./us_ghg_center/data/preprocessed_globe_data_natural"
-JSON_FOLDER_ANTHROPOGENIC = "./us_ghg_center/data/preprocessed_globe_data_anthropogenic"
 COUNTRY_TOTALS_FOLDER = "./us_ghg_center/data/country_totals"
 
 # Ensure the country totals folder exists
 os.makedirs(COUNTRY_TOTALS_FOLDER, exist_ok=True)
 
+
+def refresh_country_totals(data_types=None, progress=None, force=False, max_workers=MAX_WORKERS):
+    # Totais de todos os (tipo, ano, mês) gerados em lote; a requisição só envia o arquivo pronto
+    for data_type in data_types or DATASETS:
+        tif_folder, json_folder = DATASETS[data_type]
+        SINGLE_FLIGHT.do(('country_totals', data_type),
+                         lambda: precompute_country_totals(data_type, tif_folder, json_folder, COUNTRY_TOTALS_FOLDER,
+                                                           max_workers=max_workers, force=force, progress=progress),
+                         across_processes=True)
+
+
+# Runs after the globe datasets (it reads their data cubes when the TIFs are absent).
+# Optional: it needs the country boundaries, and the rest of the API is useful without it
+READINESS.register('country_totals', lambda progress: refresh_country_totals(progress=progress), optional=True,
+                   depends_on=tuple(DATASETS))
+
+
 @country_api.route('/api/country_totals')
 def get_country_totals():
     year = request.args.get('year')
@@ -22,43 +40,14 @@ def get_country_totals():
     if not year:
         return jsonify({"error": "Year parameter is required"}), 400
 
-    json_folder = JSON_FOLDER_ANTHROPOGENIC if data_type == 'anthropogenic' else JSON_FOLDER_NATURAL
-    input_json_path = os.path.join(json_folder, f"globe_data_{year}_{month}.json")
-    output_json_path = os.path.join(COUNTRY_TOTALS_FOLDER, f"country_totals_{data_type}_{year}_{month}.json")
-    
-    try:
-        # Check if the country totals file already exists
-        if os.path.exists(output_json_path):
-            with open(output_json_path, 'r') as f:
-                return jsonify(json.load(f))
-        
-        # If not, process the data
-        with open(input_json_path, 'r') as f:
-            globe_data = json.load(f)
-        
-        country_totals = defaultdict(float)
-        
-        # Group coordinates to make fewer calls to reverse_geocoder
-        coordinates = [(point['lat'], point['lon']) for point in globe_data]
-        country_info = rg.search(coordinates)
-        
-        for point, info in zip(globe_data, country_info):
-            country = info['cc']
-            country_totals[country] += point['value']
-        
-        result = {
-            "year": year,
-            "month": month,
-            "type": data_type,
-            "country_totals": dict(country_totals)
-        }
-        
-        # Save the result to a new JSON file
-        with open(output_json_path, 'w') as f:
-            json.dump(result, f)
-        
-        return jsonify(result)
-    except FileNotFoundError:
-        return jsonify({"error": f"Data for year {year}, month {month}, and type {data_type} not found"}), 404
-    except Exception as e:
-        return jsonify({"error": f"Error processing data: {str(e)}"}), 500
+    data_type = 'anthropogenic' if data_type == 'anthropogenic' else 'natural'
+    output_json_path = country_totals_path(COUNTRY_TOTALS_FOLDER, data_type, year, month)
+
+    # Nothing is computed here: files come from the batch stage (warm-up or /api/process_data)
+    if os.path.exists(output_json_path) and (READINESS.is_ready('country_totals') or is_current(output_json_path)):
+        return RESPONSE_CACHE.send_artifact(output_json_path)
+
+    not_ready = not_ready_response('country_totals')
+    if not_ready is not None:
+        return not_ready
+    return jsonify({"error": f"Data for year {year}, month {month}, and type {data_type} not found"}), 404
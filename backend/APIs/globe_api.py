@@ -1,13 +1,20 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, url_for
 import sys
 import os
+import time
 
 # Adicione o diretório pai ao sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from us_ghg_center.plot3d_v1 import process_all_tifs, get_globe_data, get_available_years, check_json_files
+from us_ghg_center.plot3d_v1 import process_all_tifs, get_globe_data_binary, get_globe_cells, get_available_years, check_json_files, MAX_WORKERS
+from us_ghg_center.globe_format import MIME_TYPE as BINARY_MIME_TYPE, encode_globe_binary
+from us_ghg_center.tile_pyramid import cells_to_points
+from us_ghg_center.data_cube import DataCube
+from APIs.response_cache import RESPONSE_CACHE
+from APIs.readiness import READINESS, not_ready_response
+from APIs.jobs import JOB_MANAGER
+from APIs.single_flight import SINGLE_FLIGHT
 import json
-import hashlib
 
 globe_api = Blueprint('globe_api', __name__)
 
@@ -16,44 +23,128 @@ TIF_FOLDER_ANTHROPOGENIC = "./us_ghg_center/data/processed_tiffs_antropogenic_od
 JSON_FOLDER_NATURAL = "./us_ghg_center/data/preprocessed_globe_data_natural"
 JSON_FOLDER_ANTHROPOGENIC = "./us_ghg_center/data/preprocessed_globe_data_anthropogenic"
 
-# Ensure JSON files are generated only once when the server starts
-if not check_json_files(TIF_FOLDER_NATURAL, JSON_FOLDER_NATURAL):
-    print("Natural JSON files are missing or outdated. Generating new JSON files...")
-    process_all_tifs(TIF_FOLDER_NATURAL, JSON_FOLDER_NATURAL)
-else:
-    print("All natural JSON files are up to date.")
+# Rebuilds submitted through /api/process_data leave half of the CPUs to interactive traffic
+PROCESS_DATA_WORKERS = max(1, MAX_WORKERS // 2)
 
-if not check_json_files(TIF_FOLDER_ANTHROPOGENIC, JSON_FOLDER_ANTHROPOGENIC):
-    print("Anthropogenic JSON files are missing or outdated. Generating new JSON files...")
-    process_all_tifs(TIF_FOLDER_ANTHROPOGENIC, JSON_FOLDER_ANTHROPOGENIC)
-else:
-    print("All anthropogenic JSON files are up to date.")
+DATASETS = {
+    'natural': (TIF_FOLDER_NATURAL, JSON_FOLDER_NATURAL),
+    'anthropogenic': (TIF_FOLDER_ANTHROPOGENIC, JSON_FOLDER_ANTHROPOGENIC),
+}
 
-# Cache available years for both types
-AVAILABLE_YEARS_NATURAL = get_available_years(JSON_FOLDER_NATURAL)
-AVAILABLE_YEARS_ANTHROPOGENIC = get_available_years(JSON_FOLDER_ANTHROPOGENIC)
+# Memory-mapped data cubes, opened by the warm-up; every worker shares the same OS page cache
+DATA_CUBE = DataCube()
 
-def calculate_json_hash(json_path):
-    with open(json_path, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+# Available years for both types, filled by the warm-up
+AVAILABLE_YEARS = {data_type: [] for data_type in DATASETS}
+
+
+def dataset_type(data_type):
+    return 'anthropogenic' if data_type == 'anthropogenic' else 'natural'
+
+
+def warm_up_dataset(data_type, progress=None, force=False, cancelled=None, max_workers=MAX_WORKERS):
+    """Returns True when this call ran the build, False when it joined one already in flight.
+
+    The warm-up and /api/process_data jobs may ask for the same dataset at once: only one rebuild runs,
+    the other caller waits for it. Other worker processes wait on the file lock and then find the files fresh.
+    """
+    ran = []
+
+    def build():
+        ran.append(True)
+        _build_dataset(data_type, progress, force, cancelled, max_workers)
+
+    SINGLE_FLIGHT.do(('dataset', data_type), build, across_processes=True)
+    if not ran and force and not (cancelled is not None and cancelled.is_set()):
+        # The joined build ignored this caller's force (and cancel): rebuild again now that it is done
+        return warm_up_dataset(data_type, progress, force, cancelled, max_workers)
+    return bool(ran)
+
+
+def _build_dataset(data_type, progress, force, cancelled, max_workers):
+    tif_folder, json_folder = DATASETS[data_type]
+    if force or not check_json_files(tif_folder, json_folder):
+        print(f"{data_type.capitalize()} JSON files are missing or outdated. Generating new JSON files...")
+        process_all_tifs(tif_folder, json_folder, max_workers=max_workers, force=force,
+                         progress=progress, cancelled=cancelled)
+    else:
+        print(f"All {data_type} JSON files are up to date.")
+    DATA_CUBE.open(data_type, json_folder)
+    AVAILABLE_YEARS[data_type] = get_available_years(json_folder)
+
+
+# Artifact generation runs in the background warm-up started by main.py, not at import time
+for _data_type in DATASETS:
+    READINESS.register(_data_type, lambda progress, data_type=_data_type: warm_up_dataset(data_type, progress))
+
+
+def wants_binary():
+    if request.args.get('format') == 'bin':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', BINARY_MIME_TYPE])
+    return best == BINARY_MIME_TYPE
+
+
+def parse_bbox(value):
+    west, south, east, north = (float(v) for v in value.split(','))
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south < north <= 90):
+        raise ValueError("bbox must be west,south,east,north in degrees")
+    return west, south, east, north
+
+
+def process_data_job(data_types, force):
+    def run(job):
+        result = {}
+        for data_type in data_types:
+            if job.cancelled.is_set():
+                break
+            start = time.time()
+            ran = warm_up_dataset(data_type, job.progress, force=force, cancelled=job.cancelled,
+                                  max_workers=PROCESS_DATA_WORKERS)
+            # joined: another caller's build (e.g. the warm-up) produced the files; this job's options did not apply
+            result[data_type] = {'seconds': time.time() - start, 'available_years': AVAILABLE_YEARS[data_type],
+                                 'joined': not ran}
+        if not job.cancelled.is_set():
+            # Imported here: country_api imports this module
+            from APIs.country_api import refresh_country_totals
+            refresh_country_totals(data_types, force=force, max_workers=PROCESS_DATA_WORKERS)
+        return result
+    return run
 
 
 @globe_api.route('/api/process_data', methods=['POST'])
 def process_data():
-    try:
-        process_all_tifs(TIF_FOLDER_NATURAL, JSON_FOLDER_NATURAL)
-        return jsonify({"message": "All TIF files processed successfully"}), 200
-    except Exception as e:
-        return jsonify({"error": f"Error processing TIF files: {str(e)}"}), 500
+    data_type = request.args.get('type', 'natural')
+    force = request.args.get('force', 'false').lower() in ('1', 'true', 'yes')
+    if data_type == 'all':
+        data_types = list(DATASETS)
+    elif data_type in DATASETS:
+        data_types = [data_type]
+    else:
+        return jsonify({"error": f"Unknown type {data_type}"}), 400
+
+    job, created = JOB_MANAGER.submit(('process_data', tuple(data_types), force),
+                                      process_data_job(data_types, force),
+                                      description=f"Process TIF files ({', '.join(data_types)})")
+    return jsonify({
+        "job_id": job.id,
+        "status_url": url_for('jobs_api.get_job', job_id=job.id),
+        "deduplicated": not created,
+        "state": job.state,
+    }), 202
 
 
 @globe_api.route('/api/available_years')
 def available_years():
-    data_type = request.args.get('type', 'natural')
-    if data_type == 'anthropogenic':
-        return jsonify(AVAILABLE_YEARS_ANTHROPOGENIC)
-    else:
-        return jsonify(AVAILABLE_YEARS_NATURAL)
+    data_type = dataset_type(request.args.get('type', 'natural'))
+    not_ready = not_ready_response(data_type)
+    if not_ready is not None:
+        return not_ready
+
+    years = AVAILABLE_YEARS[data_type]
+    key = ('available_years', data_type)
+    body = json.dumps(years).encode()
+    return RESPONSE_CACHE.respond(key, lambda: body, etag=RESPONSE_CACHE.etag_for(key, content=body))
 
 
 @globe_api.route('/api/globe_data')
@@ -65,94 +156,132 @@ def get_globe_data_api():
     if not year:
         return jsonify({"error": "Year parameter is required"}), 400
 
+    not_ready = not_ready_response(dataset_type(data_type))
+    if not_ready is not None:
+        return not_ready
+
     json_folder = JSON_FOLDER_ANTHROPOGENIC if data_type == 'anthropogenic' else JSON_FOLDER_NATURAL
     json_path = os.path.join(json_folder, f"globe_data_{year}_{month}.json")
-    
+
+    bbox = request.args.get('bbox')
+    zoom = request.args.get('zoom')
+    if bbox is not None or zoom is not None:
+        try:
+            bbox = parse_bbox(bbox) if bbox is not None else None
+            zoom = int(zoom) if zoom is not None else 0
+        except ValueError as e:
+            return jsonify({"error": f"Invalid bbox/zoom: {str(e)}"}), 400
+        return get_globe_cells_api(json_path, bbox, zoom, year, month, data_type)
+
     try:
-        data = get_globe_data(json_path)
-        return jsonify(data)
+        if wants_binary():
+            key = ('globe_data', data_type, year, month, 'bin')
+            return RESPONSE_CACHE.respond(key, lambda: get_globe_data_binary(json_path),
+                                          mimetype=BINARY_MIME_TYPE, source_paths=[json_path])
+        # The artifact is already JSON: stream it (or its .json.gz) straight from disk
+        return RESPONSE_CACHE.send_artifact(json_path)
     except FileNotFoundError:
         return jsonify({"error": f"Data for year {year}, month {month}, and type {data_type} not found"}), 404
     except Exception as e:
         return jsonify({"error": f"Error reading data: {str(e)}"}), 500
 
 
+def get_globe_cells_api(json_path, bbox, zoom, year, month, data_type):
+    try:
+        cells = get_globe_cells(json_path, bbox, zoom)
+        if wants_binary():
+            payload = encode_globe_binary(cells['lats'], cells['lons'], cells['values'])
+            return Response(payload, mimetype=BINARY_MIME_TYPE, headers={'X-Zoom': str(cells['zoom'])})
+        response = jsonify(cells_to_points(cells))
+        response.headers['X-Zoom'] = str(cells['zoom'])
+        return response
+    except FileNotFoundError:
+        return jsonify({"error": f"Multi-resolution data for year {year}, month {month}, and type {data_type} not found"}), 404
+    except Exception as e:
+        return jsonify({"error": f"Error reading data: {str(e)}"}), 500
+
+
 @globe_api.route('/api/compare_years')
 def compare_years():
-    year1 = '2001'
-    year2 = '2021'
-    month = '12'
+    year1 = request.args.get('year1', '2001')
+    year2 = request.args.get('year2', '2021')
+    month = request.args.get('month', '12')
+    data_type = request.args.get('type', 'natural')
 
-    json_path_2001 = os.path.join(
-        JSON_FOLDER, f"globe_data_{year1}_{month}.json")
-    json_path_2021 = os.path.join(
-        JSON_FOLDER, f"globe_data_{year2}_{month}.json")
+    not_ready = not_ready_response(dataset_type(data_type))
+    if not_ready is not None:
+        return not_ready
 
     try:
-        hash_2001 = calculate_json_hash(json_path_2001)
-        hash_2021 = calculate_json_hash(json_path_2021)
-
-        are_equal = hash_2001 == hash_2021
-
-        with open(json_path_2001, 'r') as f:
-            data_2001 = json.load(f)
-        with open(json_path_2021, 'r') as f:
-            data_2021 = json.load(f)
+        comparison = DATA_CUBE.compare(data_type, year1, year2, month)
 
         return jsonify({
-            "are_equal": are_equal,
-            "hash_2001": hash_2001,
-            "hash_2021": hash_2021,
-            "data_length_2001": len(data_2001),
-            "data_length_2021": len(data_2021),
-            "first_point_2001": data_2001[0] if data_2001 else None,
-            "first_point_2021": data_2021[0] if data_2021 else None,
+            "are_equal": comparison['number_of_differences'] == 0,
+            f"hash_{year1}": comparison['hash1'],
+            f"hash_{year2}": comparison['hash2'],
+            f"data_length_{year1}": comparison['count1'],
+            f"data_length_{year2}": comparison['count2'],
+            f"first_point_{year1}": comparison['first_point1'],
+            f"first_point_{year2}": comparison['first_point2'],
         })
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @globe_api.route('/api/compare_years_detailed')
 def compare_years_detailed():
-    year1 = '2001'
-    year2 = '2022'
-    month = '12'
+    year1 = request.args.get('year1', '2001')
+    year2 = request.args.get('year2', '2022')
+    month = request.args.get('month', '12')
+    data_type = request.args.get('type', 'natural')
 
-    json_path_2001 = os.path.join(
-        JSON_FOLDER, f"globe_data_{year1}_{month}.json")
-    json_path_2022 = os.path.join(
-        JSON_FOLDER, f"globe_data_{year2}_{month}.json")
+    not_ready = not_ready_response(dataset_type(data_type))
+    if not_ready is not None:
+        return not_ready
 
     try:
-        with open(json_path_2001, 'r') as f:
-            data_2001 = json.load(f)
-        with open(json_path_2022, 'r') as f:
-            data_2022 = json.load(f)
-
-        # Compare lengths
-        length_equal = len(data_2001) == len(data_2022)
-
-        # Compare each point
-        differences = []
-        for i, (point_2001, point_2022) in enumerate(zip(data_2001, data_2022)):
-            if point_2001 != point_2022:
-                differences.append({
-                    'index': i,
-                    'point_2001': point_2001,
-                    'point_2022': point_2022
-                })
-
-        are_equal = len(differences) == 0
+        comparison = DATA_CUBE.compare(data_type, year1, year2, month)
+        differences = [
+            {'index': d['index'], f'point_{year1}': d['point1'], f'point_{year2}': d['point2']}
+            for d in comparison['differences']
+        ]
 
         return jsonify({
-            "are_equal": are_equal,
-            "length_equal": length_equal,
-            "data_length_2001": len(data_2001),
-            "data_length_2022": len(data_2022),
-            "number_of_differences": len(differences),
-            "first_5_differences": differences[:5] if differences else None,
-            "first_point_2001": data_2001[0] if data_2001 else None,
-            "first_point_2022": data_2022[0] if data_2022 else None,
+            "are_equal": comparison['number_of_differences'] == 0,
+            "length_equal": comparison['count1'] == comparison['count2'],
+            f"data_length_{year1}": comparison['count1'],
+            f"data_length_{year2}": comparison['count2'],
+            "number_of_differences": comparison['number_of_differences'],
+            "first_5_differences": differences or None,
+            f"first_point_{year1}": comparison['first_point1'],
+            f"first_point_{year2}": comparison['first_point2'],
         })
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@globe_api.route('/api/time_series')
+def time_series():
+    data_type = request.args.get('type', 'natural')
+    month = request.args.get('month')
+
+    not_ready = not_ready_response(dataset_type(data_type))
+    if not_ready is not None:
+        return not_ready
+
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lon parameters are required"}), 400
+
+    try:
+        return jsonify(DATA_CUBE.time_series(data_type, lat, lon, month))
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,152 @@
+from flask import Blueprint, jsonify
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import threading
+import time
+import traceback
+import uuid
+
+jobs_api = Blueprint('jobs_api', __name__)
+
+JOB_WORKERS = 1  # Jobs executados ao mesmo tempo (cada um pode usar seu próprio pool de processos)
+JOB_HISTORY = 100  # Jobs finalizados mantidos para consulta
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class Job:
+    def __init__(self, key, description):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.description = description
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = 0
+        self.total = None
+        self.files = OrderedDict()
+        self.result = None
+        self.error = None
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+
+    def progress(self, done, total, file=None, seconds=None, error=None):
+        with self.lock:
+            self.done = done
+            self.total = total
+            if file is not None:
+                self.files[file] = {'state': FAILED if error else SUCCEEDED, 'seconds': seconds, 'error': error}
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'id': self.id,
+                'description': self.description,
+                'state': self.state,
+                'cancel_requested': self.cancelled.is_set(),
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'elapsed': (self.finished_at or time.time()) - self.started_at if self.started_at else None,
+                'progress': {'done': self.done, 'total': self.total},
+                'files': dict(self.files),
+                'result': self.result,
+                'error': self.error,
+            }
+
+
+class JobManager:
+    """Fila local de jobs em segundo plano, com deduplicação de submissões idênticas."""
+
+    def __init__(self, max_workers=JOB_WORKERS, history=JOB_HISTORY):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.history = history
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, key, func, description=None):
+        """Enfileira func(job); devolve (job, criado). Se já existe um job ativo com a mesma chave, devolve esse."""
+        with self.lock:
+            for job in self.jobs.values():
+                if job.key == key and job.state in ACTIVE_STATES and not job.cancelled.is_set():
+                    return job, False
+            job = Job(key, description)
+            self.jobs[job.id] = job
+            self._trim()
+        self.executor.submit(self._run, job, func)
+        return job, True
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with job.lock:
+            if job.state in ACTIVE_STATES:
+                job.cancelled.set()
+                if job.state == QUEUED:
+                    job.state = CANCELLED
+                    job.finished_at = time.time()
+        return job
+
+    def _run(self, job, func):
+        with job.lock:
+            if job.state != QUEUED:
+                return
+            job.state = RUNNING
+            job.started_at = time.time()
+        try:
+            result = func(job)
+            state, error = (CANCELLED, None) if job.cancelled.is_set() else (SUCCEEDED, None)
+        except Exception as e:
+            print(f"Job {job.id} failed: {str(e)}")
+            print(traceback.format_exc())
+            result = None
+            state, error = (CANCELLED, None) if job.cancelled.is_set() else (FAILED, str(e))
+        with job.lock:
+            job.state = state
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.state not in ACTIVE_STATES]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+
+JOB_MANAGER = JobManager()
+
+
+@jobs_api.route('/api/jobs')
+def list_jobs():
+    return jsonify([job.to_dict() for job in JOB_MANAGER.list()])
+
+
+@jobs_api.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@jobs_api.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = JOB_MANAGER.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job.to_dict()), 202
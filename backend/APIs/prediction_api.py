@@ -0,0 +1,102 @@
+from flask import Blueprint, jsonify, request
+import sys
+import os
+
+# Adicione o diretório pai ao sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from us_ghg_center.forecasts import (DEFAULT_ENGINE, FORECAST_BANDS, FORECAST_ENGINES, forecast_entry,
+                                     forecast_folder, load_forecast_manifest)
+from us_ghg_center.globe_format import MIME_TYPE as BINARY_MIME_TYPE
+from us_ghg_center.plot3d_v1 import get_globe_data_binary
+from APIs.globe_api import DATASETS, dataset_type, get_globe_cells_api, parse_bbox, wants_binary
+from APIs.response_cache import RESPONSE_CACHE
+
+prediction_api = Blueprint('prediction_api', __name__)
+
+# Previsões geradas por us_ghg_center/test/tif_predicter.py; aqui só são lidas (sem TensorFlow no servidor)
+
+
+def forecast_manifest_or_404(data_type, engine):
+    manifest = load_forecast_manifest(data_type, engine)
+    if manifest is None:
+        return None, (jsonify({"error": f"No {engine} forecasts for type {data_type}"}), 404)
+    return manifest, None
+
+
+@prediction_api.route('/api/prediction')
+def get_prediction():
+    data_type = dataset_type(request.args.get('type', 'natural'))
+    horizon = request.args.get('horizon')
+    year = request.args.get('year')
+    if horizon is None and year is None:
+        horizon = '1'
+    engine = request.args.get('engine', DEFAULT_ENGINE)
+    band = request.args.get('band', 'mean')
+    if engine not in FORECAST_ENGINES:
+        return jsonify({"error": f"engine must be one of {', '.join(FORECAST_ENGINES)}"}), 400
+    if band not in FORECAST_BANDS:
+        return jsonify({"error": f"band must be one of {', '.join(FORECAST_BANDS)}"}), 400
+
+    manifest, error = forecast_manifest_or_404(data_type, engine)
+    if error is not None:
+        return error
+    try:
+        entry = forecast_entry(manifest, horizon=horizon, year=year if horizon is None else None)
+    except ValueError:
+        return jsonify({"error": "horizon must be an integer"}), 400
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+
+    if band != 'mean' and band not in entry.get('bands', {}):
+        return jsonify({"error": f"No uncertainty band for {engine} forecasts"}), 404
+    json_path = os.path.join(forecast_folder(data_type, engine), entry['json'] if band == 'mean' else entry['bands'][band])
+
+    bbox = request.args.get('bbox')
+    zoom = request.args.get('zoom')
+    if bbox is not None or zoom is not None:
+        try:
+            bbox = parse_bbox(bbox) if bbox is not None else None
+            zoom = int(zoom) if zoom is not None else 0
+        except ValueError as e:
+            return jsonify({"error": f"Invalid bbox/zoom: {str(e)}"}), 400
+        response = get_globe_cells_api(json_path, bbox, zoom, entry['year'], '12', data_type)
+    else:
+        try:
+            if wants_binary():
+                # Mesmo formato binário do /api/globe_data; o ETag muda junto com o arquivo da previsão
+                key = ('prediction', data_type, engine, band, entry['horizon'], manifest['key'], 'bin')
+                response = RESPONSE_CACHE.respond(key, lambda: get_globe_data_binary(json_path),
+                                                  mimetype=BINARY_MIME_TYPE, source_paths=[json_path])
+            else:
+                response = RESPONSE_CACHE.send_artifact(json_path)
+        except FileNotFoundError:
+            return jsonify({"error": f"Forecast file for year {entry['year']} and type {data_type} not found"}), 404
+
+    if isinstance(response, tuple):
+        return response
+    response.headers['X-Forecast-Year'] = entry['year']
+    response.headers['X-Forecast-Horizon'] = str(entry['horizon'])
+    response.headers['X-Forecast-Engine'] = engine
+    return response
+
+
+@prediction_api.route('/api/prediction/available')
+def available_predictions():
+    data_types = [dataset_type(request.args['type'])] if 'type' in request.args else list(DATASETS)
+    result = {}
+    for data_type in data_types:
+        for engine in FORECAST_ENGINES:
+            manifest = load_forecast_manifest(data_type, engine)
+            if manifest is None:
+                continue
+            result.setdefault(data_type, {})[engine] = {
+                "key": manifest['key'],
+                "fitted_at": manifest['fitted_at'],
+                "last_year": manifest['last_year'],
+                "options": manifest['options'],
+                "interval": manifest['interval'],
+                "inputs": manifest['inputs'],
+                "forecasts": [{"horizon": entry['horizon'], "year": entry['year']} for entry in manifest['forecasts']],
+            }
+    return jsonify(result)
@@ -0,0 +1,130 @@
+from flask import Blueprint, jsonify
+import math
+import threading
+import time
+import traceback
+
+health_api = Blueprint('health_api', __name__)
+
+RETRY_AFTER_SECONDS = 30  # Retry-After enviado enquanto um dataset não está pronto
+RETRY_BACKOFF_SECONDS = 30  # Espera antes de tentar de novo um warm-up que falhou (dobra a cada falha)
+RETRY_BACKOFF_MAX_SECONDS = 15 * 60
+
+PENDING = 'pending'
+BUILDING = 'building'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class Readiness:
+    """Estado de preparação de cada dataset, preenchido pelo warm-up em segundo plano.
+
+    Cada dataset tem sua própria thread: um dataset rápido não espera a reconstrução de outro que não usa.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.datasets = {}
+        self.tasks = []
+        self.ready_events = {}
+        self.threads = None
+
+    def register(self, name, warm_up, optional=False, depends_on=()):
+        # warm_up(progress) prepara o dataset; progress(done, total, **detalhes) informa o andamento.
+        # optional: aparece no /readyz, mas não impede o serviço de ficar pronto.
+        # depends_on: datasets que precisam estar prontos antes deste começar
+        with self.lock:
+            self.datasets[name] = {'state': PENDING, 'done': 0, 'total': None, 'error': None,
+                                   'started_at': None, 'finished_at': None, 'attempts': 0, 'retry_at': None,
+                                   'optional': optional, 'depends_on': list(depends_on)}
+            self.tasks.append((name, warm_up, tuple(depends_on)))
+            self.ready_events[name] = threading.Event()
+
+    def is_ready(self, name):
+        with self.lock:
+            return name in self.datasets and self.datasets[name]['state'] == READY
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(status) for name, status in self.datasets.items()}
+
+    def start(self):
+        with self.lock:
+            if self.threads is not None:
+                return self.threads
+            self.threads = [threading.Thread(target=self._run, args=task, name=f'warm-up-{task[0]}', daemon=True)
+                            for task in self.tasks]
+        for thread in self.threads:
+            thread.start()
+        return self.threads
+
+    def _update(self, name, **changes):
+        with self.lock:
+            self.datasets[name].update(changes)
+
+    def _run(self, name, warm_up, depends_on):
+        for dependency in depends_on:
+            if dependency in self.ready_events:
+                self.ready_events[dependency].wait()
+        # FAILED não é final: tenta de novo com espera exponencial (RETRY_BACKOFF_SECONDS, dobrando até
+        # RETRY_BACKOFF_MAX_SECONDS) até dar certo
+        delay = RETRY_BACKOFF_SECONDS
+        while not self._attempt(name, warm_up, delay):
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_BACKOFF_MAX_SECONDS)
+        self.ready_events[name].set()
+
+    def _attempt(self, name, warm_up, delay):
+        # delay: espera até a próxima tentativa se esta falhar
+        print(f"Warm-up: preparing {name}...")
+        with self.lock:
+            attempts = self.datasets[name]['attempts'] + 1
+        self._update(name, state=BUILDING, started_at=time.time(), attempts=attempts, retry_at=None)
+
+        def progress(done, total, name=name, **_):
+            self._update(name, done=done, total=total)
+
+        try:
+            warm_up(progress)
+            self._update(name, state=READY, error=None, finished_at=time.time())
+            print(f"Warm-up: {name} is ready")
+            return True
+        except Exception as e:
+            print(f"Warm-up: error preparing {name} (attempt {attempts}, retrying in {delay}s): {str(e)}")
+            print(traceback.format_exc())
+            self._update(name, state=FAILED, error=str(e), finished_at=time.time(), retry_at=time.time() + delay)
+            return False
+
+
+READINESS = Readiness()
+
+
+def not_ready_response(name):
+    """Resposta 503 rápida enquanto o dataset não está pronto; None quando já pode ser servido."""
+    if READINESS.is_ready(name):
+        return None
+    status = READINESS.snapshot().get(name, {'state': PENDING})
+    response = jsonify({"error": f"Dataset {name} is not ready yet", "status": status})
+    response.status_code = 503
+    retry_after = RETRY_AFTER_SECONDS
+    if status.get('retry_at') is not None:
+        # Falhou: o cliente volta depois da próxima tentativa do warm-up
+        retry_after = max(1, math.ceil(status['retry_at'] - time.time()))
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def start_warmup():
+    return READINESS.start()
+
+
+@health_api.route('/healthz')
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@health_api.route('/readyz')
+def readyz():
+    datasets = READINESS.snapshot()
+    ready = all(status['state'] == READY for status in datasets.values() if not status['optional'])
+    return jsonify({"ready": ready, "datasets": datasets}), 200 if ready else 503
@@ -0,0 +1,206 @@
+from flask import Blueprint, Response, jsonify, request, send_file
+from collections import OrderedDict
+import gzip
+import hashlib
+import os
+import threading
+from APIs.single_flight import SINGLE_FLIGHT
+from us_ghg_center.atomic_file import gzip_path_for, write_gzip_artifact
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+cache_api = Blueprint('cache_api', __name__)
+
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # Tamanho máximo das respostas em cache (todas as variantes)
+CACHE_MAX_AGE = 3600  # Cache-Control max-age (segundos); a revalidação usa o ETag
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, GZIP_LEVEL)
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return body
+
+
+def ensure_gzip_artifact(path):
+    # Artefatos antigos (ou desatualizados) ganham o .gz na primeira requisição
+    gzip_path = gzip_path_for(path)
+
+    def build():
+        if not os.path.exists(gzip_path) or os.path.getmtime(gzip_path) < os.path.getmtime(path):
+            with open(path, 'rb') as f:
+                write_gzip_artifact(path, f.read())
+        return gzip_path
+
+    if os.path.exists(gzip_path) and os.path.getmtime(gzip_path) >= os.path.getmtime(path):
+        return gzip_path
+    return SINGLE_FLIGHT.do(('gzip_artifact', gzip_path), build)
+
+
+def supported_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def variant_etag(etag, encoding):
+    # ETag forte vale para os bytes enviados: cada codificação tem o seu
+    return etag if encoding == 'identity' else f"{etag}-{encoding}"
+
+
+class ResponseCache:
+    """LRU de respostas já serializadas, com variantes gzip/brotli e um ETag forte por variante."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evictions': 0, 'streamed': 0}
+        self._file_hashes = {}
+
+    def file_hash(self, path):
+        # Hash do conteúdo, recalculado só quando tamanho ou mtime mudam
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        digest = self._file_hashes.get(key)
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            self._file_hashes[key] = digest
+        return digest
+
+    def etag_for(self, key, source_paths=None, content=None):
+        sha256 = hashlib.sha256(repr(key).encode())
+        for path in source_paths or []:
+            sha256.update(self.file_hash(path).encode())
+        if content is not None:
+            sha256.update(content)
+        return sha256.hexdigest()[:32]
+
+    def respond(self, key, build, mimetype='application/json', source_paths=None, etag=None):
+        """Responde a partir do cache; build() só é chamado em caso de miss e devolve os bytes do corpo."""
+        if etag is None:
+            etag = self.etag_for(key, source_paths)
+        encoding = request.accept_encodings.best_match(supported_encodings()) or 'identity'
+
+        if variant_etag(etag, encoding) in request.if_none_match:
+            self._count('not_modified')
+            return self._not_modified(variant_etag(etag, encoding))
+
+        entry = self._get(key, etag)
+        if entry is None:
+            self._count('misses')
+            # Requisições simultâneas para a mesma chave geram o corpo uma única vez
+            entry = SINGLE_FLIGHT.do(('response', key, etag), lambda: self._build(key, etag, mimetype, build))
+        else:
+            self._count('hits')
+
+        body = self._variant(key, entry, encoding)
+        response = Response(body, mimetype=entry['mimetype'])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        return self._cache_headers(response, variant_etag(etag, encoding))
+
+    def send_artifact(self, path, mimetype='application/json'):
+        """Envia um artefato já serializado direto do disco, sem parse e sem cópia em memória."""
+        encoding = 'gzip' if request.accept_encodings['gzip'] else 'identity'
+        etag = variant_etag(self.etag_for(('artifact', path), [path]), encoding)
+        if etag in request.if_none_match:
+            self._count('not_modified')
+            return self._not_modified(etag)
+
+        self._count('streamed')
+        if encoding == 'gzip':
+            response = send_file(ensure_gzip_artifact(path), mimetype=mimetype, etag=etag, conditional=False)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = send_file(path, mimetype=mimetype, etag=etag, conditional=False)
+        return self._cache_headers(response, etag)
+
+    def _build(self, key, etag, mimetype, build):
+        entry = {'etag': etag, 'mimetype': mimetype, 'variants': {'identity': build()}}
+        self._put(key, entry)
+        return entry
+
+    def stats_snapshot(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, entries=len(self.entries), bytes=self.size, max_bytes=self.max_bytes,
+                        hit_ratio=self.stats['hits'] / lookups if lookups else None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _get(self, key, etag):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry['etag'] != etag:
+                # Artefato de origem mudou
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            self.size += len(entry['variants']['identity'])
+            self._evict()
+
+    def _variant(self, key, entry, encoding):
+        body = entry['variants'].get(encoding)
+        if body is not None:
+            return body
+        body = compress(entry['variants']['identity'], encoding)
+        with self.lock:
+            if self.entries.get(key) is entry and encoding not in entry['variants']:
+                entry['variants'][encoding] = body
+                self.size += len(body)
+                self._evict()
+        return body
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.size -= sum(len(body) for body in entry['variants'].values())
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            self.stats['evictions'] += 1
+
+    def _not_modified(self, etag):
+        return self._cache_headers(Response(status=304), etag)
+
+    @staticmethod
+    def _cache_headers(response, etag):
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f"public, max-age={CACHE_MAX_AGE}"
+        response.vary.add('Accept-Encoding')
+        response.vary.add('Accept')
+        return response
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+@cache_api.route('/api/cache_stats')
+def cache_stats():
+    return jsonify(dict(RESPONSE_CACHE.stats_snapshot(), single_flight=SINGLE_FLIGHT.stats_snapshot()))
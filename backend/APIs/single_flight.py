@@ -0,0 +1,87 @@
+import threading
+import time
+
+from us_ghg_center.file_lock import file_lock
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Uma única computação em andamento por chave; as chamadas concorrentes esperam e recebem o mesmo resultado."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {'calls': 0, 'executions': 0, 'shared': 0, 'errors': 0,
+                      'lock_contended': 0, 'lock_wait_seconds': 0.0, 'shared_wait_seconds': 0.0}
+
+    def _acquire(self):
+        # Conta quantas vezes o lock já estava ocupado e quanto tempo se esperou por ele
+        if self.lock.acquire(blocking=False):
+            return 0.0
+        start = time.perf_counter()
+        self.lock.acquire()
+        return time.perf_counter() - start
+
+    def do(self, key, func, across_processes=False):
+        """across_processes=True: o líder ainda espera um file_lock da chave, então só um processo executa por vez
+        (os outros rodam depois e, com os artefatos já prontos, terminam rápido)."""
+        waited = self._acquire()
+        try:
+            self.stats['calls'] += 1
+            if waited:
+                self.stats['lock_contended'] += 1
+                self.stats['lock_wait_seconds'] += waited
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.stats['executions'] += 1
+            else:
+                call.waiters += 1
+                self.stats['shared'] += 1
+        finally:
+            self.lock.release()
+
+        if not leader:
+            start = time.perf_counter()
+            call.done.wait()
+            with self.lock:
+                self.stats['shared_wait_seconds'] += time.perf_counter() - start
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if across_processes:
+                with file_lock(('single_flight', key)):
+                    call.result = func()
+            else:
+                call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self.lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self.lock:
+            return {repr(key): call.waiters for key, call in self.calls.items()}
+
+    def stats_snapshot(self):
+        with self.lock:
+            return dict(self.stats, in_flight=len(self.calls))
+
+
+SINGLE_FLIGHT = SingleFlight()
@@ -1,14 +1,23 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 import sys
 import os
+import glob
+import json
 
 # Adicione o diretório pai ao sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from wildfire_emissions.src.data_processing import load_and_preprocess_data
 from wildfire_emissions.src.emissions_calculation import calculate_emissions
-from wildfire_emissions.src.geo_processing import load_and_process_shapefile
+from wildfire_emissions.src.geo_processing import load_state_centroids, shapefile_inputs
 from wildfire_emissions.src.json_generator import generate_plot_data, save_json
+from wildfire_emissions.src.fire_cube import FireCube
+from wildfire_emissions.src.scenarios import GROUP_BY, ScenarioEngine
+from wildfire_emissions.src.emissions_calculation import DEFAULT_EMISSION_FACTOR
+from us_ghg_center.artifact_cache import ARTIFACT_CACHE
+from APIs.single_flight import SINGLE_FLIGHT
+from APIs.response_cache import RESPONSE_CACHE
+from APIs.readiness import READINESS, not_ready_response
 import traceback
 
 wildfire_api = Blueprint('wildfire_api', __name__)
@@ -16,12 +25,53 @@ wildfire_api = Blueprint('wildfire_api', __name__)
 WILDFIRE_CSV_FOLDER = './wildfire_emissions/data/csv'
 WILDFIRE_SHAPEFILE_PATH = './wildfire_emissions/data/shp/BR_UF_2022.shp'
 WILDFIRE_OUTPUT_FILE = './wildfire_emissions/data/json/plot_data.json'
+WILDFIRE_PLOT_DATA_VERSION = 1  # Aumente ao mudar o processamento: invalida o plot_data.json no cache de artefatos
 
-# Variável global para armazenar os dados processados de wildfire
+# Variáveis globais com os dados processados de wildfire (publicadas juntas pelo warm-up)
 wildfire_plot_data = None
+wildfire_cube = None
+wildfire_scenarios = None
 
 def process_wildfire_data():
-    global wildfire_plot_data
+    # Requisições simultâneas compartilham um único processamento (e só um processo reconstrói por vez)
+    return SINGLE_FLIGHT.do('wildfire_plot_data', _process_wildfire_data, across_processes=True)
+
+
+def wildfire_inputs():
+    # CSVs e todos os arquivos do shapefile: qualquer mudança gera uma nova chave no cache
+    return sorted(glob.glob(os.path.join(WILDFIRE_CSV_FOLDER, '*.csv'))) + shapefile_inputs(WILDFIRE_SHAPEFILE_PATH)
+
+
+def _process_wildfire_data():
+    global wildfire_plot_data, wildfire_cube, wildfire_scenarios
+    produced = []
+    outputs = {os.path.basename(WILDFIRE_OUTPUT_FILE): WILDFIRE_OUTPUT_FILE}
+    key, status = ARTIFACT_CACHE.get_or_create('wildfire_plot_data', outputs, lambda: produced.append(_build_plot_data()),
+                                             inputs=wildfire_inputs(), version=WILDFIRE_PLOT_DATA_VERSION)
+    if produced:
+        plot_data = produced[0]
+    else:
+        print(f"Reutilizando '{WILDFIRE_OUTPUT_FILE}' ({status} no cache de artefatos)")
+        with open(WILDFIRE_OUTPUT_FILE, 'r', encoding='utf-8') as f:
+            plot_data = json.load(f)
+
+    # Chave do artefato (hash das entradas + versão): identifica o plot_data publicado, igual em todo worker e restart
+    cube = FireCube(plot_data, version=key)
+    scenarios = ScenarioEngine(cube)
+    print(f"Cubo de queimadas: {len(cube.states)} estados x {len(cube.years)} anos x {len(cube.months)} meses")
+
+    # Só publica os dados depois de prontos: leitores nunca veem um estado parcial
+    wildfire_plot_data = plot_data
+    wildfire_cube = cube
+    wildfire_scenarios = scenarios
+    return plot_data
+
+
+# CSVs, shapefile e geopandas são carregados no warm-up em segundo plano, não na primeira requisição
+READINESS.register('wildfire', lambda progress: process_wildfire_data())
+
+
+def _build_plot_data():
     try:
         print("1. Iniciando o carregamento e pré-processamento dos dados...")
         full_data = load_and_preprocess_data(WILDFIRE_CSV_FOLDER)
@@ -31,17 +81,18 @@ def process_wildfire_data():
         full_data = calculate_emissions(full_data)
         print("4. Emissões calculadas com sucesso.")
 
-        print("5. Carregando e processando o shapefile...")
-        br_states = load_and_process_shapefile(WILDFIRE_SHAPEFILE_PATH)
-        print("6. Shapefile carregado e processado com sucesso.")
+        print("5. Carregando os centroides dos estados...")
+        br_states = load_state_centroids(WILDFIRE_SHAPEFILE_PATH)
+        print("6. Centroides dos estados carregados com sucesso.")
 
         print("7. Gerando dados para plotagem...")
-        wildfire_plot_data = generate_plot_data(full_data, br_states)
+        plot_data = generate_plot_data(full_data, br_states)
         print("8. Dados para plotagem gerados com sucesso.")
 
         print("9. Salvando dados em JSON...")
-        save_json(wildfire_plot_data, WILDFIRE_OUTPUT_FILE)
+        save_json(plot_data, WILDFIRE_OUTPUT_FILE)
         print(f"10. Dados para plotagem gerados e salvos em '{WILDFIRE_OUTPUT_FILE}'")
+        return plot_data
     except Exception as e:
         print(f"Erro durante o processamento de dados: {str(e)}")
         print(traceback.format_exc())
@@ -49,15 +100,62 @@ def process_wildfire_data():
 
 @wildfire_api.route('/api/fire_data')
 def get_fire_data():
-    global wildfire_plot_data
+    not_ready = not_ready_response('wildfire')
+    if not_ready is not None:
+        return not_ready
+
+    year = request.args.get('year')
+    month = request.args.get('month')
+    state = request.args.get('state')
+    aggregate = request.args.get('aggregate')
+    if aggregate not in (None, 'total'):
+        return jsonify({"error": "aggregate must be 'total'"}), 400
+
+    cube = wildfire_cube
     try:
-        print("Requisição recebida para /api/fire_data")
-        if wildfire_plot_data is None:
-            print("Dados ainda não processados. Iniciando processamento...")
-            process_wildfire_data()
-        print("Retornando dados processados...")
-        return jsonify(wildfire_plot_data)
-    except Exception as e:
-        print(f"Erro ao retornar dados: {str(e)}")
-        print(traceback.format_exc())
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        cube.selection(year, month, state)
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+
+    def build():
+        query = cube.totals if aggregate == 'total' else cube.records
+        return json.dumps(query(year, month, state)).encode()
+
+    key = ('fire_data', year, month, state, aggregate, cube.version)
+    return RESPONSE_CACHE.respond(key, build)
+
+
+@wildfire_api.route('/api/emission_scenarios', methods=['GET', 'POST'])
+def emission_scenarios():
+    not_ready = not_ready_response('wildfire')
+    if not_ready is not None:
+        return not_ready
+
+    engine = wildfire_scenarios
+    if request.method == 'GET':
+        # Eixos esperados na matriz de fatores
+        return jsonify({
+            "states": engine.states,
+            "months": engine.months,
+            "years": engine.years,
+            "default_factor": DEFAULT_EMISSION_FACTOR,
+            "group_by": list(GROUP_BY),
+        })
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or 'factors' not in body:
+        return jsonify({"error": "JSON body with 'factors' is required"}), 400
+    by = body.get('by', 'scenario')
+    year = body.get('year')
+    try:
+        totals = engine.totals(body['factors'], by=by, year=year, states=body.get('states'),
+                               default_factor=body.get('default_factor', DEFAULT_EMISSION_FACTOR))
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    result = {"by": by, "year": year, "scenarios": len(totals), "totals": totals.tolist()}
+    if by != 'scenario':
+        result[by + 's'] = engine.axis(by, year)
+    return jsonify(result)
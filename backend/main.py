@@ -3,6 +3,10 @@ from flask_cors import CORS
 from APIs.globe_api import globe_api
 from APIs.wildfire_api import wildfire_api
 from APIs.country_api import country_api  # Add this line
+from APIs.response_cache import cache_api
+from APIs.readiness import health_api, start_warmup
+from APIs.jobs import jobs_api
+from APIs.prediction_api import prediction_api
 
 app = Flask(__name__)
 CORS(app)
@@ -11,6 +15,15 @@ CORS(app)
 app.register_blueprint(globe_api)
 app.register_blueprint(wildfire_api)
 app.register_blueprint(country_api)  # Add this line
+app.register_blueprint(cache_api)
+app.register_blueprint(health_api)
+app.register_blueprint(jobs_api)
+app.register_blueprint(prediction_api)
+
+# Generate/open the data artifacts in the background so the server can bind its port right away.
+# Every worker process warms up its own state; rebuilds are serialized across processes by file locks,
+# so only the first worker does the heavy work and the others find the artifacts fresh
+start_warmup()
 
 @app.route('/')
 def home():
@@ -36,9 +49,14 @@ def home():
         <h3>1. Globe Data</h3>
         <p>Use: <code>/api/globe_data?year=YYYY&type=TYPE&month=MM</code></p>
         <p>Example: <code>/api/globe_data?year=2021&type=natural</code></p>
+        <p>Add <code>format=bin</code> (or send <code>Accept: application/octet-stream</code>) to get the compact binary columnar format.</p>
+        <p>Add <code>zoom=Z</code> and optionally <code>bbox=west,south,east,north</code> to get block mean/max cells at the matching level of detail.</p>
+        <p>Example: <code>/api/globe_data?year=2021&type=anthropogenic&zoom=4&bbox=-47,-24,-46,-23</code></p>
         
         <h3>2. Wildfire Data</h3>
-        <p>Use: <code>/api/fire_data</code></p>
+        <p>Use: <code>/api/fire_data?year=YYYY&month=MONTH&state=STATE&aggregate=total</code> (all parameters optional)</p>
+        <p>Example: <code>/api/fire_data?year=2020&month=9&aggregate=total</code> (MONTH is a number or the Portuguese name, e.g. <code>Setembro</code>)</p>
+        <p>Emission scenarios: <code>GET /api/emission_scenarios</code> lists the state and month axes; <code>POST /api/emission_scenarios</code> with <code>{"factors": [[...], ...], "by": "scenario|state|year|month", "year": YYYY}</code> returns the emission totals of every scenario (factors are scenario &times; state, optionally &times; month)</p>
         
         <h3>3. Country Totals</h3>
         <p>Use: <code>/api/country_totals?year=YYYY&type=TYPE&month=MM</code></p>
@@ -48,17 +66,29 @@ def home():
         <p>Use: <code>/api/available_years?type=TYPE</code></p>
         <p>Example: <code>/api/available_years?type=natural</code></p>
         
+        <h3>5. Predictions</h3>
+        <p>Use: <code>/api/prediction?type=TYPE&horizon=N</code> (or <code>year=YYYY</code>): precomputed forecast N years after the last input year, in the same JSON/binary/zoom formats as the globe data</p>
+        <p>Optional: <code>engine=cnn_lstm|linear|seasonal_naive|exponential_smoothing</code> (default cnn_lstm; the per-pixel baseline engines go up to 2050) and <code>band=mean|lower|upper</code> for the baselines' uncertainty band</p>
+        <p>Example: <code>/api/prediction?type=natural&year=2050&engine=linear&format=bin</code>; <code>/api/prediction/available</code> lists the forecasts of each engine</p>
+        
         <h2>Additional Endpoints:</h2>
         <ul>
-            <li><code>/api/process_data</code> (POST method)</li>
-            <li><code>/api/compare_years</code></li>
-            <li><code>/api/compare_years_detailed</code></li>
+            <li><code>/api/process_data?type=TYPE&force=false</code> (POST method, TYPE may also be <code>all</code>): queues a rebuild and returns a job ID</li>
+            <li><code>/api/jobs/JOB_ID</code> (GET for progress, DELETE to cancel)</li>
+            <li><code>/api/compare_years?year1=YYYY&year2=YYYY&type=TYPE&month=MM</code></li>
+            <li><code>/api/compare_years_detailed?year1=YYYY&year2=YYYY&type=TYPE&month=MM</code></li>
+            <li><code>/api/time_series?lat=LAT&lon=LON&type=TYPE</code></li>
+            <li><code>/api/cache_stats</code></li>
+            <li><code>/healthz</code> (liveness) and <code>/readyz</code> (per-dataset readiness)</li>
         </ul>
         
+        <p>While a dataset is still being prepared, its endpoints answer 503 with a <code>Retry-After</code> header.</p>
+
         <p>Replace YYYY with the desired year, TYPE with 'natural' or 'anthropogenic', and MM with the month (default is 12).</p>
     </body>
     </html>
     """
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # No reloader: it would import this module twice and run two warm-ups side by side
+    app.run(debug=True, use_reloader=False)
@@ -0,0 +1,289 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from .atomic_file import atomic_open, atomic_path
+from .file_lock import ProcessRLock
+
+# Cache de artefatos derivados, endereçado pelo hash do conteúdo das entradas, da versão do código e dos parâmetros
+ARTIFACT_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "artifact_cache")
+ARTIFACT_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024  # Tamanho máximo das cópias guardadas (as menos usadas saem primeiro)
+INDEX_NAME = "index.json"
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _link_or_copy(src, dest):
+    # Hard link quando possível (mesmo disco, sem cópia); troca atômica do destino
+    with atomic_path(dest, mode=None) as tmp_path:
+        os.remove(tmp_path)
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copy2(src, tmp_path)
+
+
+class ArtifactCache:
+    """Artefatos guardados por chave = hash(tipo, versão, parâmetros, conteúdo das entradas)."""
+
+    def __init__(self, root=ARTIFACT_CACHE_FOLDER, max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Índice relido e gravado sob um lock entre processos: workers diferentes não perdem entradas uns dos outros
+        self.lock = ProcessRLock(lambda: ('artifact_cache', os.path.abspath(self.root)))
+        self._index = None
+        self._index_mtime = None
+
+    # Índice: entradas do cache, destinos materializados e hashes já calculados das entradas
+
+    def _index_path(self):
+        return os.path.join(self.root, INDEX_NAME)
+
+    def _load(self):
+        path = self._index_path()
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if self._index is None or mtime != self._index_mtime:
+            # Relê quando outro processo (ex.: a CLI) alterou o índice
+            index = {'entries': {}, 'outputs': {}, 'file_hashes': {}}
+            if mtime is not None:
+                try:
+                    with open(path, 'r') as f:
+                        index.update(json.load(f))
+                except ValueError:
+                    print(f"Artifact cache index {path} is corrupted, starting a new one")
+            self._index = index
+            self._index_mtime = mtime
+        return self._index
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        with atomic_open(self._index_path()) as f:
+            json.dump(self._index, f)
+        self._index_mtime = os.path.getmtime(self._index_path())
+
+    def _object_dir(self, key):
+        return os.path.join(self.root, "objects", key[:2], key)
+
+    # Chaves
+
+    def input_hash(self, path):
+        # sha256 do conteúdo, recalculado só quando tamanho ou mtime mudam
+        stat = os.stat(path)
+        abspath = os.path.abspath(path)
+        with self.lock:
+            memo = self._load()['file_hashes'].get(abspath)
+        if memo is not None and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+        digest = file_hash(path)
+        with self.lock:
+            self._load()['file_hashes'][abspath] = [stat.st_size, stat.st_mtime_ns, digest]
+            self._save()
+        return digest
+
+    def key_for(self, kind, inputs=(), params=None, version=None):
+        description = {
+            'kind': kind,
+            'version': version,
+            'params': params or {},
+            'inputs': [self.input_hash(path) for path in inputs],
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    # Consulta e gravação
+
+    def is_fresh(self, key, outputs):
+        """True se todos os destinos existem e foram gerados (ou materializados) para esta chave."""
+        with self.lock:
+            recorded = self._load()['outputs']
+            for dest in outputs.values():
+                record = recorded.get(os.path.abspath(dest))
+                if record is None or record[0] != key or not os.path.exists(dest):
+                    return False
+                stat = os.stat(dest)
+                if record[1] != stat.st_size or record[2] != stat.st_mtime_ns:
+                    return False
+        return True
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self._load()['entries'].get(key)
+            if entry is None:
+                return None
+            if not all(os.path.exists(os.path.join(self._object_dir(key), name)) for name in entry['files']):
+                self._remove(key)
+                self._save()
+                return None
+            return entry
+
+    def store(self, key, kind, outputs, description=None):
+        object_dir = self._object_dir(key)
+        os.makedirs(os.path.dirname(object_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(object_dir), prefix=f".{key}.")
+        files = {}
+        for name, dest in outputs.items():
+            _link_or_copy(dest, os.path.join(tmp_dir, name))
+            files[name] = os.path.getsize(dest)
+
+        with self.lock:
+            index = self._load()
+            if os.path.exists(object_dir):
+                shutil.rmtree(object_dir)
+            os.replace(tmp_dir, object_dir)
+            now = time.time()
+            index['entries'][key] = {'kind': kind, 'files': files, 'size': sum(files.values()),
+                                     'created': now, 'last_used': now, 'description': description or {}}
+            self._record_outputs(key, outputs)
+            self._evict(keep=key)
+            self._save()
+
+    def materialize(self, key, outputs):
+        with self.lock:
+            object_dir = self._object_dir(key)
+            for name, dest in outputs.items():
+                os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+                _link_or_copy(os.path.join(object_dir, name), dest)
+            self._load()['entries'][key]['last_used'] = time.time()
+            self._record_outputs(key, outputs)
+            self._save()
+
+    def _record_outputs(self, key, outputs):
+        recorded = self._load()['outputs']
+        for dest in outputs.values():
+            stat = os.stat(dest)
+            recorded[os.path.abspath(dest)] = [key, stat.st_size, stat.st_mtime_ns]
+
+    def release(self, outputs):
+        # Destinos materializados são hard links dos objetos do cache: antes que um produtor os reescreva no lugar,
+        # cada um vira uma cópia própria (trocada de forma atômica, sem deixar o arquivo ausente)
+        for dest in outputs.values():
+            if os.path.exists(dest) and os.stat(dest).st_nlink > 1:
+                with atomic_path(dest, mode=None) as tmp_path:
+                    shutil.copy2(dest, tmp_path)
+
+    def get_or_create(self, kind, outputs, produce, inputs=(), params=None, version=None, key=None):
+        """Garante os arquivos em outputs ({nome: destino}); devolve (chave, 'fresh' | 'hit' | 'miss').
+
+        produce() só é chamado em caso de miss e deve escrever todos os destinos.
+        """
+        if key is None:
+            key = self.key_for(kind, inputs, params, version)
+        if self.is_fresh(key, outputs):
+            return key, 'fresh'
+        if self.lookup(key) is not None:
+            self.materialize(key, outputs)
+            return key, 'hit'
+
+        self.release(outputs)
+        produce()
+        self.store(key, kind, outputs, {'inputs': [os.path.abspath(path) for path in inputs],
+                                        'params': params or {}, 'version': version})
+        return key, 'miss'
+
+    # Manutenção
+
+    def entries(self, kind=None):
+        with self.lock:
+            return [dict(entry, key=key) for key, entry in self._load()['entries'].items()
+                    if kind is None or entry['kind'] == kind]
+
+    def prune(self, max_bytes=None, older_than=None, kind=None):
+        """Remove entradas sem uso há mais de older_than segundos e, depois, as menos usadas até caber em max_bytes."""
+        with self.lock:
+            index = self._load()
+            removed = []
+            now = time.time()
+            for key, entry in list(index['entries'].items()):
+                if kind is not None and entry['kind'] != kind:
+                    continue
+                if older_than is not None and now - entry['last_used'] > older_than:
+                    self._remove(key)
+                    removed.append(key)
+            if max_bytes is not None:
+                removed += self._evict(max_bytes=max_bytes, kind=kind)
+
+            # Registros de arquivos que não existem mais
+            index['file_hashes'] = {path: memo for path, memo in index['file_hashes'].items() if os.path.exists(path)}
+            index['outputs'] = {path: record for path, record in index['outputs'].items() if os.path.exists(path)}
+            self._save()
+            return removed
+
+    def _evict(self, max_bytes=None, kind=None, keep=None):
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self._load()['entries']
+        total = sum(entry['size'] for entry in entries.values())
+        removed = []
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= max_bytes:
+                break
+            if key == keep or (kind is not None and entry['kind'] != kind):
+                continue
+            total -= entry['size']
+            self._remove(key)
+            removed.append(key)
+        return removed
+
+    def _remove(self, key):
+        shutil.rmtree(self._object_dir(key), ignore_errors=True)
+        self._load()['entries'].pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            entries = self._load()['entries']
+            kinds = {}
+            for entry in entries.values():
+                count, size = kinds.get(entry['kind'], (0, 0))
+                kinds[entry['kind']] = (count + 1, size + entry['size'])
+            return {
+                'entries': len(entries),
+                'bytes': sum(entry['size'] for entry in entries.values()),
+                'max_bytes': self.max_bytes,
+                'kinds': {kind: {'entries': count, 'bytes': size} for kind, (count, size) in kinds.items()},
+            }
+
+
+ARTIFACT_CACHE = ArtifactCache()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List and prune the derived-artifact cache")
+    parser.add_argument('--root', default=ARTIFACT_CACHE_FOLDER, help="Cache folder")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = commands.add_parser('list', help="List cached artifacts, most recently used first")
+    list_parser.add_argument('--kind')
+    commands.add_parser('stats', help="Entries and bytes per kind")
+    prune_parser = commands.add_parser('prune', help="Remove old or least recently used artifacts")
+    prune_parser.add_argument('--kind')
+    prune_parser.add_argument('--max-mb', type=float, help="Keep at most this many MB")
+    prune_parser.add_argument('--older-than-days', type=float, help="Remove entries not used for this many days")
+    prune_parser.add_argument('--all', action='store_true', help="Remove every entry (of --kind, if given)")
+    args = parser.parse_args(argv)
+
+    cache = ArtifactCache(args.root)
+    if args.command == 'list':
+        for entry in sorted(cache.entries(args.kind), key=lambda entry: -entry['last_used']):
+            last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))
+            inputs = ', '.join(os.path.basename(path) for path in entry['description'].get('inputs', []))
+            print(f"{entry['key'][:12]}  {entry['kind']:<16} {entry['size'] / 1024 / 1024:9.2f} MB  {last_used}  {inputs}")
+    elif args.command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+    else:
+        max_bytes = 0 if args.all else (None if args.max_mb is None else int(args.max_mb * 1024 * 1024))
+        older_than = None if args.older_than_days is None else args.older_than_days * 86400
+        removed = cache.prune(max_bytes=max_bytes, older_than=older_than, kind=args.kind)
+        print(f"Removed {len(removed)} entries")
+        print(json.dumps(cache.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
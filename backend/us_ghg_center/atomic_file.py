@@ -0,0 +1,52 @@
+import gzip
+import os
+import tempfile
+from contextlib import contextmanager
+
+# Escritas atômicas: temporário exclusivo na pasta do destino + os.replace. Quem lê nunca vê um arquivo pela metade,
+# e escritores concorrentes (workers do gunicorn, warm-up e jobs) não compartilham o mesmo .tmp
+FILE_MODE = 0o644
+ARTIFACT_GZIP_LEVEL = 9  # Cópias .gz servidas como estão (comprimidas uma única vez, ao gravar o artefato)
+
+
+@contextmanager
+def atomic_path(path, suffix='', mode=FILE_MODE):
+    """Caminho temporário exclusivo ao lado de path; substitui path ao sair sem erro, e é apagado se der erro.
+
+    suffix: extensão que a biblioteca de escrita exige (np.save/np.savez acrescentam .npy/.npz, o rasterio usa .tif).
+    mode=None mantém as permissões do temporário (ex.: hard link de outro arquivo).
+    """
+    folder = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix=f".tmp{suffix}")
+    os.close(fd)
+    try:
+        yield tmp_path
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def atomic_open(path, mode='w', **kwargs):
+    """open() num temporário que só substitui path depois de fechado sem erro."""
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+
+
+def atomic_write(path, body):
+    with atomic_open(path, 'wb') as f:
+        f.write(body)
+    return path
+
+
+def gzip_path_for(path):
+    return f"{path}.gz"
+
+
+def write_gzip_artifact(path, body):
+    return atomic_write(gzip_path_for(path), gzip.compress(body, ARTIFACT_GZIP_LEVEL))
@@ -0,0 +1,188 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import urllib.request
+import zipfile
+from functools import lru_cache
+
+import numpy as np
+from rasterio import features
+from rasterio.transform import Affine, from_bounds
+
+from .raster_io import iter_windows, valid_mask
+from .artifact_cache import ARTIFACT_CACHE
+from .atomic_file import atomic_open, atomic_path
+
+# Raster de IDs de país alinhado à grade de cada dataset, gerado uma vez por resolução
+COUNTRY_MASK_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "country_masks")
+NATURAL_EARTH_RESOLUTION = '50m'
+NATURAL_EARTH_URL = "https://naturalearth.s3.amazonaws.com/{resolution}_cultural/ne_{resolution}_admin_0_countries.zip"
+BOUNDARIES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "natural_earth")
+# Shapefile de países, baixado na construção da imagem (Dockerfile); o servidor nunca baixa nada
+COUNTRY_BOUNDARIES_PATH = os.path.join(BOUNDARIES_FOLDER, f"ne_{NATURAL_EARTH_RESOLUTION}_admin_0_countries.shp")
+COUNTRY_CODE_COLUMNS = ('ISO_A2_EH', 'ISO_A2', 'iso_a2', 'ADM0_A3', 'iso_a3')  # Primeira coluna com código válido
+EARTH_RADIUS = 6371008.8  # Raio médio da Terra em metros
+MASK_BLOCK_ROWS = 2048  # Linhas rasterizadas por vez ao gerar a máscara
+NO_COUNTRY = 0  # ID das células fora de qualquer país (oceano)
+COUNTRY_MASK_VERSION = 1  # Aumente ao mudar a rasterização: invalida as máscaras no cache de artefatos
+
+
+def boundaries_path():
+    if not os.path.exists(COUNTRY_BOUNDARIES_PATH):
+        raise FileNotFoundError(f"Country boundaries not found at {COUNTRY_BOUNDARIES_PATH}; "
+                                f"run `python -m us_ghg_center.country_mask` to download them")
+    return COUNTRY_BOUNDARIES_PATH
+
+
+def download_boundaries(folder=BOUNDARIES_FOLDER, resolution=NATURAL_EARTH_RESOLUTION, timeout=120):
+    # Natural Earth admin 0 (países) extraído numa pasta temporária e trocado de uma vez
+    url = NATURAL_EARTH_URL.format(resolution=resolution)
+    print(f"Downloading country boundaries from {url}")
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        archive = zipfile.ZipFile(io.BytesIO(response.read()))
+    parent = os.path.dirname(os.path.abspath(folder))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".natural_earth.")
+    try:
+        archive.extractall(tmp_dir)
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.replace(tmp_dir, folder)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    print(f"Country boundaries saved to {folder}")
+    return folder
+
+
+def boundaries_inputs(path=None):
+    # Shapefile e arquivos auxiliares (os códigos ficam no .dbf): todos entram na chave da máscara
+    stem = os.path.splitext(path or boundaries_path())[0]
+    return [f"{stem}{ext}" for ext in ('.shp', '.shx', '.dbf', '.prj') if os.path.exists(f"{stem}{ext}")]
+
+
+def load_countries(path=None):
+    # Lista de (código do país, geometria); países com várias feições compartilham o código
+    import geopandas as gpd
+    countries = gpd.read_file(path or boundaries_path())
+    if countries.crs is not None and not countries.crs.is_geographic:
+        countries = countries.to_crs(epsg=4326)
+    columns = [column for column in COUNTRY_CODE_COLUMNS if column in countries.columns]
+    if not columns:
+        raise ValueError(f"No country code column found (expected one of {', '.join(COUNTRY_CODE_COLUMNS)})")
+
+    result = []
+    for _, row in countries.iterrows():
+        code = next((row[column] for column in columns if isinstance(row[column], str) and row[column] not in ('', '-99')), None)
+        if code is not None and row.geometry is not None:
+            result.append((code, row.geometry))
+    return result
+
+
+def _mask_key(shape, transform):
+    grid = json.dumps([list(shape), list(transform)[:6]])
+    return f"countries_{shape[0]}x{shape[1]}_{hashlib.sha256(grid.encode()).hexdigest()[:12]}"
+
+
+def mask_paths(shape, transform, mask_folder=COUNTRY_MASK_FOLDER):
+    key = _mask_key(shape, transform)
+    return os.path.join(mask_folder, f"{key}.npy"), os.path.join(mask_folder, f"{key}.json")
+
+
+def build_country_mask(shape, transform, mask_folder=COUNTRY_MASK_FOLDER, countries=None):
+    mask_path, codes_path = mask_paths(shape, transform, mask_folder)
+    countries = countries if countries is not None else load_countries()
+    codes = sorted({code for code, _ in countries})
+    ids = {code: i + 1 for i, code in enumerate(codes)}
+    dtype = np.uint8 if len(codes) < 255 else np.uint16
+    shapes = [(geometry, ids[code]) for code, geometry in countries]
+
+    # Rasteriza em faixas de linhas para não alocar a grade inteira de uma vez
+    os.makedirs(mask_folder, exist_ok=True)
+    print(f"Building country mask {mask_path} ({shape[0]} x {shape[1]}, {len(codes)} countries)")
+    with atomic_path(mask_path, suffix='.npy') as tmp_path:
+        mask = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=tuple(shape))
+        for row_off in range(0, shape[0], MASK_BLOCK_ROWS):
+            rows = min(MASK_BLOCK_ROWS, shape[0] - row_off)
+            window_transform = transform * Affine.translation(0, row_off)
+            mask[row_off:row_off + rows] = features.rasterize(shapes, out_shape=(rows, shape[1]),
+                                                              transform=window_transform, fill=NO_COUNTRY, dtype=dtype)
+        mask.flush()
+        del mask
+
+    with atomic_open(codes_path) as f:
+        json.dump({'codes': codes, 'shape': list(shape), 'transform': list(transform)[:6]}, f)
+    return mask_path
+
+
+@lru_cache(maxsize=8)
+def _load_country_mask(mask_path, codes_path, mtime):
+    with open(codes_path, 'r') as f:
+        codes = json.load(f)['codes']
+    return np.load(mask_path, mmap_mode='r'), [None] + codes
+
+
+def load_country_mask(shape, transform, mask_folder=COUNTRY_MASK_FOLDER):
+    """Máscara (memmap) e lista de códigos indexada pelo ID; gera a máscara na primeira chamada."""
+    mask_path, codes_path = mask_paths(shape, transform, mask_folder)
+    boundaries = boundaries_path()
+    ARTIFACT_CACHE.get_or_create(
+        'country_mask',
+        {os.path.basename(mask_path): mask_path, os.path.basename(codes_path): codes_path},
+        lambda: build_country_mask(shape, transform, mask_folder, load_countries(boundaries)),
+        inputs=boundaries_inputs(boundaries),
+        params={'shape': list(shape), 'transform': list(transform)[:6], 'code_columns': list(COUNTRY_CODE_COLUMNS)},
+        version=COUNTRY_MASK_VERSION)
+    return _load_country_mask(mask_path, codes_path, os.path.getmtime(codes_path))
+
+
+def row_areas(transform, height):
+    # Área (m²) de uma célula em cada linha de uma grade em graus: R² · Δlon · (sen φ1 − sen φ2)
+    tops = np.radians(transform.f + transform.e * np.arange(height))
+    bottoms = np.radians(transform.f + transform.e * np.arange(1, height + 1))
+    return EARTH_RADIUS ** 2 * np.radians(abs(transform.a)) * np.abs(np.sin(tops) - np.sin(bottoms))
+
+
+def _accumulate(totals, ids, data, areas, nodata=None):
+    weighted = np.where(valid_mask(data, nodata), data, 0).astype(np.float64) * areas[:, None]
+    totals += np.bincount(ids.ravel(), weights=weighted.ravel(), minlength=totals.size)
+
+
+def _totals_dict(totals, codes):
+    return {
+        'country_totals': {codes[i]: float(totals[i]) for i in np.flatnonzero(totals) if i != NO_COUNTRY},
+        'unassigned_total': float(totals[NO_COUNTRY]),
+    }
+
+
+def country_totals_from_raster(src, band=1, mask_folder=COUNTRY_MASK_FOLDER):
+    """Totais por país da banda em resolução total, lida janela a janela e ponderada pela área das células."""
+    mask, codes = load_country_mask((src.height, src.width), src.transform, mask_folder)
+    areas = row_areas(src.transform, src.height)
+    totals = np.zeros(len(codes), dtype=np.float64)
+    for window in iter_windows(src, band):
+        rows = slice(window.row_off, window.row_off + window.height)
+        _accumulate(totals, mask[rows], src.read(band, window=window), areas[rows], src.nodata)
+    return _totals_dict(totals, codes)
+
+
+def country_totals_from_grid(grid, bounds, mask_folder=COUNTRY_MASK_FOLDER):
+    # Mesmo cálculo sobre uma grade já em memória (ex.: fatia do cubo de dados, NaN = sem dado)
+    west, south, east, north = bounds
+    height, width = grid.shape
+    transform = from_bounds(west, south, east, north, width, height)
+    mask, codes = load_country_mask((height, width), transform, mask_folder)
+    totals = np.zeros(len(codes), dtype=np.float64)
+    _accumulate(totals, mask, np.asarray(grid), row_areas(transform, height))
+    return _totals_dict(totals, codes)
+
+
+if __name__ == '__main__':
+    # Chamado pelo Dockerfile: python -m us_ghg_center.country_mask
+    if os.path.exists(COUNTRY_BOUNDARIES_PATH):
+        print(f"Country boundaries already present at {COUNTRY_BOUNDARIES_PATH}")
+    else:
+        download_boundaries()
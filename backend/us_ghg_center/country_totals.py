@@ -0,0 +1,202 @@
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+
+from .artifact_cache import ARTIFACT_CACHE
+from .atomic_file import atomic_path, atomic_write
+from .country_mask import (COUNTRY_MASK_FOLDER, NO_COUNTRY, boundaries_inputs, country_totals_from_raster,
+                           load_country_mask, row_areas)
+from .data_cube import CUBE_NAME, load_cube_index
+from .plot3d_v1 import MAX_WORKERS, tif_date
+
+# Totais por país de todos os (tipo, ano, mês), gerados em lote e servidos sem cálculo na requisição
+COUNTRY_TOTALS_METHOD = "country_mask"  # Arquivos gerados por outro método (amostragem + reverse_geocoder) são refeitos
+COUNTRY_TOTALS_TABLE = "country_totals.npz"
+COUNTRY_TOTALS_VERSION = 1  # Aumente ao mudar o cálculo: invalida os totais no cache de artefatos
+ARTIFACT_KIND = "country_totals"
+STACK_SLICES = 4  # Fatias do cubo somadas por bincount (limita a memória da passada vetorizada)
+
+
+def country_totals_path(output_folder, data_type, year, month):
+    return os.path.join(output_folder, f"country_totals_{data_type}_{year}_{month}.json")
+
+
+def is_current(output_path):
+    # Gerado pelo método da máscara (a validade em relação às fontes fica com o cache de artefatos)
+    if not os.path.exists(output_path):
+        return False
+    with open(output_path, 'r') as f:
+        return json.load(f).get('method') == COUNTRY_TOTALS_METHOD
+
+
+def write_country_totals(output_path, data_type, year, month, totals):
+    result = {
+        "year": year,
+        "month": month,
+        "type": data_type,
+        "method": COUNTRY_TOTALS_METHOD,
+        "area_weighted": True,
+        **totals
+    }
+    return atomic_write(output_path, json.dumps(result).encode())
+
+
+def _tif_totals(tif_file, mask_folder):
+    with rasterio.open(tif_file) as src:
+        return country_totals_from_raster(src, mask_folder=mask_folder)
+
+
+def _prepare_masks(tif_files, mask_folder):
+    # Gera no processo principal as máscaras de cada grade distinta, antes de abrir o pool
+    grids = {}
+    for tif_file in tif_files:
+        with rasterio.open(tif_file) as src:
+            grids[((src.height, src.width), tuple(src.transform)[:6])] = src.transform
+    for (shape, _), transform in grids.items():
+        load_country_mask(shape, transform, mask_folder)
+
+
+def _cube_totals(cube_folder, mask_folder, dates=None):
+    # Várias fatias do cubo por bincount: cada fatia ganha um deslocamento nos IDs de país
+    index = load_cube_index(cube_folder)
+    if index is None:
+        return {}
+    cube = np.load(os.path.join(cube_folder, CUBE_NAME), mmap_mode='r')
+    west, south, east, north = index['bounds']
+    height, width = cube.shape[2:]
+    transform = from_bounds(west, south, east, north, width, height)
+    mask, codes = load_country_mask((height, width), transform, mask_folder)
+    ids = mask.astype(np.int64).ravel()
+    areas = row_areas(transform, height)[:, None]
+    n_codes = len(codes)
+
+    slices = [(y, m, year, month) for y, year in enumerate(index['years']) for m, month in enumerate(index['months'])
+              if (dates is None or (year, month) in dates) and not np.all(np.isnan(cube[y, m]))]
+    results = {}
+    for start in range(0, len(slices), STACK_SLICES):
+        chunk = slices[start:start + STACK_SLICES]
+        weights = np.concatenate([(np.nan_to_num(cube[y, m].astype(np.float64)) * areas).ravel() for y, m, _, _ in chunk])
+        offsets = np.repeat(np.arange(len(chunk)) * n_codes, ids.size)
+        sums = np.bincount(np.tile(ids, len(chunk)) + offsets, weights=weights, minlength=len(chunk) * n_codes)
+        for k, (_, _, year, month) in enumerate(chunk):
+            totals = sums[k * n_codes:(k + 1) * n_codes]
+            results[(year, month)] = {
+                'country_totals': {codes[i]: float(totals[i]) for i in np.flatnonzero(totals) if i != NO_COUNTRY},
+                'unassigned_total': float(totals[NO_COUNTRY]),
+            }
+    return results
+
+
+def _store(key, output_path, inputs, params):
+    ARTIFACT_CACHE.store(key, ARTIFACT_KIND, {os.path.basename(output_path): output_path},
+                         {'inputs': [os.path.abspath(path) for path in inputs], 'params': params,
+                          'version': COUNTRY_TOTALS_VERSION})
+
+
+def precompute_country_totals(data_type, tif_folder, cube_folder, output_folder, max_workers=MAX_WORKERS,
+                              force=False, mask_folder=COUNTRY_MASK_FOLDER, progress=None):
+    """Calcula (ou atualiza) os totais de todos os meses de um tipo; devolve o número de arquivos gerados."""
+    os.makedirs(output_folder, exist_ok=True)
+    boundaries = boundaries_inputs()
+
+    # (fonte, ano, mês, entradas, parâmetros): TIFs em resolução total, ou as fatias do cubo quando não há TIFs
+    tif_files = sorted(glob.glob(os.path.join(tif_folder, "*.tif")))
+    if tif_files:
+        sources = [(tif_file, *tif_date(tif_file), [tif_file] + boundaries, {'method': COUNTRY_TOTALS_METHOD})
+                   for tif_file in tif_files]
+    else:
+        index = load_cube_index(cube_folder)
+        cube_path = os.path.join(cube_folder, CUBE_NAME)
+        sources = [] if index is None else [
+            (cube_path, year, month, [cube_path] + boundaries,
+             {'method': COUNTRY_TOTALS_METHOD, 'year': year, 'month': month})
+            for year in index['years'] for month in index['months']
+        ]
+
+    done = 0
+    pending = []
+    for source, year, month, inputs, params in sources:
+        output_path = country_totals_path(output_folder, data_type, year, month)
+        outputs = {os.path.basename(output_path): output_path}
+        key = ARTIFACT_CACHE.key_for(ARTIFACT_KIND, inputs, params, COUNTRY_TOTALS_VERSION)
+        if not force and ARTIFACT_CACHE.is_fresh(key, outputs):
+            continue
+        if not force and ARTIFACT_CACHE.lookup(key) is not None:
+            ARTIFACT_CACHE.materialize(key, outputs)
+            done += 1
+            continue
+        ARTIFACT_CACHE.release(outputs)
+        pending.append((source, year, month, inputs, params, output_path, key))
+
+    print(f"Found {len(pending)} of {len(sources)} {data_type} country totals to (re)compute")
+    if progress is not None:
+        progress(0, len(pending))
+
+    if pending and tif_files:
+        _prepare_masks([source for source, *_ in pending], mask_folder)
+        with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+            futures = {executor.submit(_tif_totals, item[0], mask_folder): item for item in pending}
+            for future in as_completed(futures):
+                source, year, month, inputs, params, output_path, key = futures[future]
+                write_country_totals(output_path, data_type, year, month, future.result())
+                _store(key, output_path, inputs, params)
+                done += 1
+                if progress is not None:
+                    progress(done, len(pending), file=os.path.basename(source))
+    elif pending:
+        # Sem os TIFs de origem, usa o cubo de dados já gerado
+        by_date = {(year, month): item for _, year, month, *item in pending}
+        for (year, month), totals in _cube_totals(cube_folder, mask_folder, set(by_date)).items():
+            inputs, params, output_path, key = by_date[(year, month)]
+            write_country_totals(output_path, data_type, year, month, totals)
+            _store(key, output_path, inputs, params)
+            done += 1
+
+    if done or not os.path.exists(os.path.join(output_folder, COUNTRY_TOTALS_TABLE)):
+        write_country_totals_table(output_folder)
+    return done
+
+
+def write_country_totals_table(output_folder):
+    # Tabela compacta (entrada x país) com todos os arquivos JSON atuais da pasta
+    entries = []
+    for path in sorted(glob.glob(os.path.join(output_folder, "country_totals_*_*_*.json"))):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('method') == COUNTRY_TOTALS_METHOD:
+            entries.append(data)
+    if not entries:
+        print(f"No country totals in {output_folder}; table not written")
+        return None
+
+    codes = sorted({code for data in entries for code in data['country_totals']})
+    column = {code: i for i, code in enumerate(codes)}
+    totals = np.zeros((len(entries), len(codes)), dtype=np.float64)
+    for row, data in enumerate(entries):
+        for code, value in data['country_totals'].items():
+            totals[row, column[code]] = value
+
+    table_path = os.path.join(output_folder, COUNTRY_TOTALS_TABLE)
+    with atomic_path(table_path, suffix='.npz') as tmp_path:
+        np.savez(tmp_path,
+                 types=np.array([data['type'] for data in entries], dtype=str),
+                 years=np.array([data['year'] for data in entries], dtype=str),
+                 months=np.array([data['month'] for data in entries], dtype=str),
+                 codes=np.array(codes, dtype=str),
+                 totals=totals,
+                 unassigned=np.array([data.get('unassigned_total', 0.0) for data in entries], dtype=np.float64))
+    print(f"Country totals table saved to: {table_path} ({len(entries)} entries, {len(codes)} countries)")
+    return table_path
+
+
+def load_country_totals_table(output_folder):
+    table_path = os.path.join(output_folder, COUNTRY_TOTALS_TABLE)
+    if not os.path.exists(table_path):
+        return None
+    with np.load(table_path) as npz:
+        return {key: npz[key] for key in npz.files}
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+
+from .atomic_file import atomic_open, atomic_path
+from .raster_io import read_decimated, valid_mask
+
+# Cubo (ano, mês, lat, lon) em float32 mapeado em memória, um por tipo de dado
+CUBE_WIDTH = 3600  # Largura da grade do cubo (0.1° em uma grade global)
+CUBE_NAME = "cube.npy"
+CUBE_INDEX_NAME = "cube.json"
+
+
+def _cube_shape(src, width=CUBE_WIDTH):
+    width = min(src.width, width)
+    return max(1, round(src.height * width / src.width)), width
+
+
+def _read_slice(tif_file, shape):
+    with rasterio.open(tif_file) as src:
+        data = read_decimated(src, out_shape=shape, resampling=Resampling.average).astype(np.float32, copy=False)
+        data[~valid_mask(data, src.nodata)] = np.nan
+        return data, tuple(src.bounds)
+
+
+def load_cube_index(cube_folder):
+    index_path = os.path.join(cube_folder, CUBE_INDEX_NAME)
+    if not os.path.exists(index_path) or not os.path.exists(os.path.join(cube_folder, CUBE_NAME)):
+        return None
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+
+def build_cube(tif_dates, cube_folder, stale_tifs=None, width=CUBE_WIDTH):
+    # tif_dates: lista de (caminho do TIF, ano, mês)
+    if not tif_dates:
+        return None
+
+    years = sorted({year for _, year, _ in tif_dates})
+    months = sorted({month for _, _, month in tif_dates})
+    with rasterio.open(tif_dates[0][0]) as src:
+        shape = (len(years), len(months)) + _cube_shape(src, width)
+
+    cube_path = os.path.join(cube_folder, CUBE_NAME)
+    index = load_cube_index(cube_folder)
+    reuse = (index is not None and stale_tifs is not None and index['years'] == years
+             and index['months'] == months and tuple(index['shape']) == shape)
+
+    # Sempre escreve num arquivo novo e troca com os.replace: os outros workers continuam lendo o cubo antigo
+    # (mapeado) até reabrirem, nunca uma fatia pela metade
+    os.makedirs(cube_folder, exist_ok=True)
+    with atomic_path(cube_path, suffix='.npy') as tmp_path:
+        if reuse:
+            # Mesmas datas e grade: copia o cubo atual e só reescreve as fatias dos TIFs alterados
+            shutil.copyfile(cube_path, tmp_path)
+            cube = np.load(tmp_path, mmap_mode='r+')
+            stale = {os.path.abspath(tif_file) for tif_file in stale_tifs}
+            to_write = [date for date in tif_dates if os.path.abspath(date[0]) in stale]
+        else:
+            cube = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+            cube[:] = np.nan
+            to_write = tif_dates
+
+        bounds = index['bounds'] if reuse else None
+        print(f"Writing {len(to_write)} slices into data cube {cube_path} {shape}")
+        for tif_file, year, month in to_write:
+            data, bounds = _read_slice(tif_file, shape[2:])
+            cube[years.index(year), months.index(month)] = data
+        cube.flush()
+        del cube
+
+    index = {'years': years, 'months': months, 'shape': list(shape), 'bounds': list(bounds)}
+    with atomic_open(os.path.join(cube_folder, CUBE_INDEX_NAME)) as f:
+        json.dump(index, f)
+    return index
+
+
+def _index_mtime(cube_folder):
+    try:
+        return os.stat(os.path.join(cube_folder, CUBE_INDEX_NAME)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class DataCube:
+    """Cubos (tipo, ano, mês, lat, lon) abertos uma vez e compartilhados via page cache do SO.
+
+    Reabertos quando o cube.json muda, ou seja, quando qualquer processo reconstruiu o cubo.
+    """
+
+    def __init__(self, cube_folders=None):
+        self.cubes = {}
+        self.indexes = {}
+        self.folders = {}
+        self.index_mtimes = {}
+        for data_type, cube_folder in (cube_folders or {}).items():
+            self.open(data_type, cube_folder)
+
+    def open(self, data_type, cube_folder):
+        self.folders[data_type] = cube_folder
+        self.index_mtimes[data_type] = _index_mtime(cube_folder)
+        index = load_cube_index(cube_folder)
+        if index is None:
+            print(f"No data cube found for {data_type} in {cube_folder}")
+            return False
+        # mmap_mode='r': todos os workers leem as mesmas páginas, sem cópia própria dos dados
+        cube = np.load(os.path.join(cube_folder, CUBE_NAME), mmap_mode='r')
+        if list(cube.shape) != index['shape']:
+            # Cubo novo já trocado, índice ainda não: fica com o que estava aberto até o índice chegar
+            print(f"Data cube for {data_type} is being replaced; keeping the previous one")
+            self.index_mtimes[data_type] = None
+            return data_type in self.cubes
+        self.indexes[data_type] = index
+        self.cubes[data_type] = cube
+        print(f"Opened data cube for {data_type}: {index['shape']}")
+        return True
+
+    def _refresh(self, data_type):
+        cube_folder = self.folders.get(data_type)
+        if cube_folder is not None and _index_mtime(cube_folder) != self.index_mtimes.get(data_type):
+            self.open(data_type, cube_folder)
+
+    def has(self, data_type):
+        self._refresh(data_type)
+        return data_type in self.cubes
+
+    def grid(self, data_type, year, month='12'):
+        index = self._index(data_type)
+        try:
+            return self.cubes[data_type][index['years'].index(str(year)), index['months'].index(str(month))]
+        except ValueError:
+            raise KeyError(f"No data for year {year}, month {month}, and type {data_type}")
+
+    def coordinates(self, data_type):
+        # Centros das células (lats decrescentes, como nos TIFs)
+        west, south, east, north = self._index(data_type)['bounds']
+        height, width = self.cubes[data_type].shape[2:]
+        lats = north - (np.arange(height) + 0.5) * (north - south) / height
+        lons = west + (np.arange(width) + 0.5) * (east - west) / width
+        return lats, lons
+
+    def cell(self, data_type, lat, lon):
+        west, south, east, north = self._index(data_type)['bounds']
+        height, width = self.cubes[data_type].shape[2:]
+        row = int(np.clip((north - lat) / (north - south) * height, 0, height - 1))
+        col = int(np.clip((lon - west) / (east - west) * width, 0, width - 1))
+        return row, col
+
+    def time_series(self, data_type, lat, lon, month=None):
+        index = self._index(data_type)
+        row, col = self.cell(data_type, lat, lon)
+        series = self.cubes[data_type][:, :, row, col]
+        result = []
+        for y, year in enumerate(index['years']):
+            for m, cube_month in enumerate(index['months']):
+                if month is not None and cube_month != str(month):
+                    continue
+                value = float(series[y, m])
+                result.append({'year': year, 'month': cube_month, 'value': None if np.isnan(value) else value})
+        return result
+
+    def first_point(self, data_type, grid):
+        flat_idx = np.flatnonzero(~np.isnan(grid))
+        if flat_idx.size == 0:
+            return None
+        return self.point(data_type, grid, flat_idx[0])
+
+    def point(self, data_type, grid, flat_idx):
+        lats, lons = self.coordinates(data_type)
+        row, col = divmod(int(flat_idx), grid.shape[1])
+        value = float(grid[row, col])
+        return {'lat': float(lats[row]), 'lon': float(lons[col]), 'value': None if np.isnan(value) else value}
+
+    def compare(self, data_type, year1, year2, month='12', max_differences=5):
+        grid1 = self.grid(data_type, year1, month)
+        grid2 = self.grid(data_type, year2, month)
+        valid1 = ~np.isnan(grid1)
+        valid2 = ~np.isnan(grid2)
+        different = (grid1 != grid2) & (valid1 | valid2)
+        difference_idx = np.flatnonzero(different)
+        return {
+            'hash1': hashlib.md5(np.ascontiguousarray(grid1).tobytes()).hexdigest(),
+            'hash2': hashlib.md5(np.ascontiguousarray(grid2).tobytes()).hexdigest(),
+            'count1': int(np.count_nonzero(valid1)),
+            'count2': int(np.count_nonzero(valid2)),
+            'number_of_differences': int(difference_idx.size),
+            'differences': [
+                {'index': int(i), 'point1': self.point(data_type, grid1, i), 'point2': self.point(data_type, grid2, i)}
+                for i in difference_idx[:max_differences]
+            ],
+            'first_point1': self.first_point(data_type, grid1),
+            'first_point2': self.first_point(data_type, grid2),
+        }
+
+    def _index(self, data_type):
+        self._refresh(data_type)
+        if data_type not in self.indexes:
+            raise KeyError(f"No data cube for type {data_type}")
+        return self.indexes[data_type]
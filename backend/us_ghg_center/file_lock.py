@@ -0,0 +1,58 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Locks entre processos (flock): workers do gunicorn ou o servidor e a CLI mexendo nos mesmos artefatos
+LOCK_FOLDER = os.path.join(tempfile.gettempdir(), "ghg-backend-locks")
+
+
+def lock_path(name, folder=LOCK_FOLDER):
+    digest = hashlib.sha256(repr(name).encode()).hexdigest()[:32]
+    return os.path.join(folder, f"{digest}.lock")
+
+
+@contextmanager
+def file_lock(name, folder=LOCK_FOLDER):
+    """Lock exclusivo por nome entre processos; liberado pelo SO se o processo morrer."""
+    os.makedirs(folder, exist_ok=True)
+    fd = os.open(lock_path(name, folder), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class ProcessRLock:
+    """RLock do processo + file_lock: reentrante dentro do processo, exclusivo entre processos."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.held = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        if self.depth == 0:
+            try:
+                held = file_lock(self.name() if callable(self.name) else self.name)
+                held.__enter__()
+            except BaseException:
+                self.lock.release()
+                raise
+            self.held = held
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0:
+            held, self.held = self.held, None
+            held.__exit__(*exc_info)
+        self.lock.release()
+        return False
@@ -0,0 +1,146 @@
+import numpy as np
+
+# Previsores de base por pixel: ajuste vetorizado sobre a pilha (anos, altura, largura), sem TensorFlow
+BASELINE_ENGINES = ('linear', 'seasonal_naive', 'exponential_smoothing')
+BLOCK_ROWS = 512  # Linhas ajustadas por vez (limita a memória em float64 nas grades em resolução total)
+SEASON = 1  # Período sazonal em anos do seasonal_naive (1 = repete o último ano)
+ALPHA = 0.5  # Suavização do nível (exponential_smoothing, método de Holt)
+BETA = 0.1  # Suavização da tendência
+
+
+class BaselineForecaster:
+    """Tendência por pixel (linear, seasonal_naive ou exponential_smoothing) com faixas de incerteza opcionais.
+
+    Mesma interface do previsor CNN-LSTM: fit(pilha) e depois forecast(horizontes, interval).
+    """
+
+    supports_intervals = True
+
+    def __init__(self, method='linear', season=SEASON, alpha=ALPHA, beta=BETA, block_rows=BLOCK_ROWS):
+        if method not in BASELINE_ENGINES:
+            raise ValueError(f"Unknown baseline engine {method} (expected one of {', '.join(BASELINE_ENGINES)})")
+        self.method = method
+        self.season = season
+        self.alpha = alpha
+        self.beta = beta
+        self.block_rows = block_rows
+        self.params = None
+
+    def options(self):
+        # Tudo o que muda o resultado (entra na chave das previsões em cache)
+        return {'method': self.method, 'season': self.season, 'alpha': self.alpha, 'beta': self.beta}
+
+    def fit(self, stack):
+        years, height, width = stack.shape
+        minimum = self.season + 1 if self.method == 'seasonal_naive' else 2
+        if years < minimum:
+            raise ValueError(f"{self.method} needs at least {minimum} years, got {years}")
+
+        fit_block = getattr(self, f"_fit_{self.method}")
+        self.params = None
+        for row in range(0, height, self.block_rows):
+            rows = slice(row, min(row + self.block_rows, height))
+            fitted = fit_block(np.asarray(stack[:, rows], dtype=np.float64))
+            if self.params is None:
+                self.params = {name: np.empty(value.shape[:-2] + (height, width), dtype=np.float64)
+                               for name, value in fitted.items()}
+            for name, value in fitted.items():
+                self.params[name][..., rows, :] = value
+        self.years = years
+        return self
+
+    def forecast(self, horizons, interval=None):
+        """(média, inferior, superior) com forma (horizontes, altura, largura); sem interval as faixas são None."""
+        forecast_step = getattr(self, f"_forecast_{self.method}")
+        shape = (horizons,) + self.params['sigma'].shape
+        mean = np.empty(shape, dtype=np.float32)
+        lower = upper = None
+        if interval is not None:
+            from scipy.stats import norm
+            z = norm.ppf(0.5 + interval / 2)
+            lower, upper = np.empty(shape, dtype=np.float32), np.empty(shape, dtype=np.float32)
+        # Um horizonte por vez: só a saída em float32 ocupa (horizontes, altura, largura)
+        for step in range(1, horizons + 1):
+            mean[step - 1], sd = forecast_step(step)
+            if interval is not None:
+                lower[step - 1] = mean[step - 1] - z * sd
+                upper[step - 1] = mean[step - 1] + z * sd
+        return mean, lower, upper
+
+    # Regressão linear por pixel (mínimos quadrados, anos sem dado ignorados)
+
+    def _fit_linear(self, block):
+        t = np.arange(len(block), dtype=np.float64)[:, None, None]
+        valid = np.isfinite(block)
+        n = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t_mean = (t * valid).sum(axis=0) / n
+            y_mean = np.where(valid, block, 0).sum(axis=0) / n
+            dt = np.where(valid, t - t_mean, 0)
+            sxx = (dt ** 2).sum(axis=0)
+            slope = (dt * np.where(valid, block - y_mean, 0)).sum(axis=0) / sxx
+            residuals = np.where(valid, block - (y_mean + slope * (t - t_mean)), 0)
+            sigma = np.sqrt((residuals ** 2).sum(axis=0) / (n - 2))
+        sigma[n <= 2] = np.nan
+        return {'t_mean': t_mean, 'y_mean': y_mean, 'slope': slope, 'sxx': sxx, 'n': n.astype(np.float64),
+                'sigma': sigma}
+
+    def _forecast_linear(self, step):
+        p = self.params
+        t = self.years - 1 + step
+        mean = p['y_mean'] + p['slope'] * (t - p['t_mean'])
+        # Erro de previsão da regressão: σ·√(1 + 1/n + (t − t̄)²/Sxx)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sd = p['sigma'] * np.sqrt(1 + 1 / p['n'] + (t - p['t_mean']) ** 2 / p['sxx'])
+        return mean, sd
+
+    # Ingênuo sazonal: repete o último período; o erro cresce com o número de períodos à frente
+
+    def _fit_seasonal_naive(self, block):
+        differences = block[self.season:] - block[:-self.season]
+        valid = np.isfinite(differences)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sigma = np.sqrt((np.where(valid, differences, 0) ** 2).sum(axis=0) / valid.sum(axis=0))
+        return {'last': block[-self.season:], 'sigma': sigma}
+
+    def _forecast_seasonal_naive(self, step):
+        periods = (step - 1) // self.season + 1
+        return self.params['last'][(step - 1) % self.season], self.params['sigma'] * np.sqrt(periods)
+
+    # Suavização exponencial com tendência (Holt), uma passada pelos anos para todos os pixels de uma vez
+
+    def _fit_exponential_smoothing(self, block):
+        level = block[0].copy()
+        trend = block[1] - block[0]
+        squared_errors = np.zeros_like(level)
+        counts = np.zeros_like(level)
+        for value in block[1:]:
+            forecast = level + trend
+            valid = np.isfinite(value)
+            # Pixels sem nenhum valor ainda começam no primeiro ano disponível
+            start = valid & ~np.isfinite(level)
+            level[start] = value[start]
+            trend[start] = 0
+            error = np.where(valid & ~start, value - forecast, 0)
+            squared_errors += error ** 2
+            counts += valid & ~start
+            new_level = np.where(valid & ~start, self.alpha * value + (1 - self.alpha) * forecast, np.where(start, level, forecast))
+            trend = np.where(valid & ~start, self.beta * (new_level - level) + (1 - self.beta) * trend,
+                             np.where(np.isfinite(trend), trend, 0))
+            level = new_level
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sigma = np.sqrt(squared_errors / counts)
+        return {'level': level, 'trend': trend, 'sigma': sigma}
+
+    def _forecast_exponential_smoothing(self, step):
+        p = self.params
+        # Variância de h passos à frente no método de Holt: σ²·(1 + Σ_{j<h} α²(1 + jβ)²)
+        j = np.arange(1, step, dtype=np.float64)
+        factor = np.sqrt(1 + np.sum(self.alpha ** 2 * (1 + j * self.beta) ** 2))
+        return p['level'] + step * p['trend'], p['sigma'] * factor
+
+
+def get_forecaster(name, **options):
+    if name not in BASELINE_ENGINES:
+        raise KeyError(f"Unknown forecast engine {name}")
+    return BaselineForecaster(name, **options)
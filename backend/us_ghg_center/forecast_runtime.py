@@ -0,0 +1,131 @@
+"""Runtime TFLite do CNN-LSTM: previsões sem importar o TensorFlow (extra opcional, requirements-inference.txt).
+
+O modelo é exportado com lote estático de MAX_BATCH janelas (tif_predicter.export_tflite) e cada chamada completa o
+lote com zeros, então uma janela custa o mesmo que um lote cheio. Em test/forecast_runtime_benchmark.py: 1 janela
+192 ms no TFLite contra 130 ms no Keras; 8 janelas 212 ms contra 216 ms. Em troca, importar leva 0.01 s (Keras 4.6 s)
+e o processo ocupa 208 MB (Keras 810 MB). Requisições avulsas devem passar pelo ForecastBatcher.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from .forecasts import MODEL_FOLDER, load_manifest, model_paths
+
+# Interpretador TFLite leve (LiteRT, ou o antigo tflite-runtime): a API não importa o TensorFlow inteiro.
+# Extra opcional: pip install -r requirements-inference.txt (na imagem: docker build --build-arg INFERENCE=1).
+# Sem ele, cai no tensorflow.lite, com o custo de importação e memória do TensorFlow
+try:
+    from ai_edge_litert.interpreter import Interpreter
+except ImportError:
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        Interpreter = None
+
+INFERENCE_THREADS = 1  # Threads do interpretador por worker (os pods são só CPU e rodam vários workers)
+MAX_BATCH = 8  # Janelas agrupadas numa única chamada ao modelo
+BATCH_WAIT_SECONDS = 0.01  # Espera máxima por outras requisições antes de rodar o lote
+
+
+def tflite_path(data_type, model_folder=MODEL_FOLDER):
+    model_path, _ = model_paths(data_type, model_folder)
+    return os.path.splitext(model_path)[0] + '.tflite'
+
+
+def _interpreter_class():
+    if Interpreter is not None:
+        return Interpreter
+    # Último recurso: o interpretador embutido no TensorFlow (funciona, mas com o custo de importar o TF)
+    print("ai-edge-litert/tflite-runtime not installed; falling back to tensorflow.lite")
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class ForecastRuntime:
+    """Modelo CNN-LSTM exportado em TFLite; recebe janelas (lote, anos, altura, largura) em unidades dos dados."""
+
+    def __init__(self, model_path, normalization, num_threads=INFERENCE_THREADS):
+        self.interpreter = _interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.normalization = normalization
+        self.batch_size = self.input['shape'][0]  # Lote fixo do modelo exportado (MAX_BATCH em tif_predicter.export_tflite)
+        self.lock = threading.Lock()  # O interpretador não é thread-safe
+        self.interpreter.allocate_tensors()
+
+    @classmethod
+    def load(cls, data_type, model_folder=MODEL_FOLDER, num_threads=INFERENCE_THREADS):
+        _, manifest_path = model_paths(data_type, model_folder)
+        manifest = load_manifest(manifest_path)
+        if manifest is None:
+            raise FileNotFoundError(manifest_path)
+        return cls(tflite_path(data_type, model_folder), manifest['normalization'], num_threads)
+
+    def predict(self, windows):
+        """Previsão do ano seguinte para cada janela: (lote, anos, altura, largura) -> (lote, altura, largura)."""
+        windows = np.asarray(windows, dtype=np.float32)
+        low, high = self.normalization['min'], self.normalization['max']
+        scale = (high - low) or 1
+        batch = ((windows - low) / scale)[..., np.newaxis]
+
+        predictions = []
+        with self.lock:
+            # Lote estático (o LSTM só vira ops nativas do TFLite assim): completa com zeros ou divide em partes
+            for start in range(0, len(batch), self.batch_size):
+                chunk = batch[start:start + self.batch_size]
+                padded = np.zeros(self.input['shape'], dtype=np.float32)
+                padded[:len(chunk)] = chunk
+                self.interpreter.set_tensor(self.input['index'], padded)
+                self.interpreter.invoke()
+                predictions.append(self.interpreter.get_tensor(self.output['index'])[:len(chunk)])
+        prediction = np.concatenate(predictions)
+        return prediction.reshape(windows.shape[0], *windows.shape[2:]) * scale + low
+
+
+class ForecastBatcher:
+    """Junta previsões pedidas ao mesmo tempo (até MAX_BATCH, esperando até BATCH_WAIT_SECONDS) numa única chamada."""
+
+    def __init__(self, runtime, max_batch=MAX_BATCH, max_wait=BATCH_WAIT_SECONDS):
+        self.runtime = runtime
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.stats = {'requests': 0, 'batches': 0}
+        self.thread = threading.Thread(target=self._run, name='forecast-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, window):
+        future = Future()
+        self.queue.put((window, future))
+        return future
+
+    def predict(self, window):
+        return self.submit(window).result()
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self.stats['requests'] += len(items)
+            self.stats['batches'] += 1
+            try:
+                predictions = self.runtime.predict(np.stack([window for window, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), prediction in zip(items, predictions):
+                future.set_result(prediction)
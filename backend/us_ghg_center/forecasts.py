@@ -0,0 +1,72 @@
+import json
+import os
+from functools import lru_cache
+
+from .atomic_file import atomic_open
+from .forecast_engines import BASELINE_ENGINES
+
+# Modelos treinados e previsões pré-calculadas (uma pasta por tipo de dado), lidos pela API sem TensorFlow
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MODEL_FOLDER = os.path.join(DATA_FOLDER, "models")
+FORECAST_FOLDER = os.path.join(DATA_FOLDER, "forecasts")
+FORECAST_MANIFEST = "forecast_manifest.json"
+DEFAULT_ENGINE = 'cnn_lstm'  # Motor servido quando a requisição não escolhe outro
+FORECAST_ENGINES = (DEFAULT_ENGINE,) + BASELINE_ENGINES
+FORECAST_BANDS = ('mean', 'lower', 'upper')  # Previsão central e limites da faixa de incerteza
+
+
+def model_paths(data_type, model_folder=MODEL_FOLDER):
+    # Modelo Keras e o manifesto com o hash das entradas, hiperparâmetros e estatísticas de normalização
+    return (os.path.join(model_folder, f"cnn_lstm_{data_type}.keras"),
+            os.path.join(model_folder, f"cnn_lstm_{data_type}.json"))
+
+
+def forecast_folder(data_type, engine=DEFAULT_ENGINE, root=FORECAST_FOLDER):
+    return os.path.join(root, data_type, engine)
+
+
+def _forecast_name(horizon, band):
+    return f"forecast_h{horizon}" if band == 'mean' else f"forecast_h{horizon}_{band}"
+
+
+def forecast_tif_path(folder, horizon, band='mean'):
+    return os.path.join(folder, f"{_forecast_name(horizon, band)}.tif")
+
+
+def forecast_json_path(folder, horizon, band='mean'):
+    # Mesmo formato dos dados do globo: .json, .json.gz, .bin e pirâmide ao lado
+    return os.path.join(folder, f"{_forecast_name(horizon, band)}.json")
+
+
+def write_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_open(path) as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+@lru_cache(maxsize=16)
+def _load_manifest(path, mtime_ns):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_manifest(path):
+    """Manifesto (relido só quando o arquivo muda) ou None se ainda não existe."""
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _load_manifest(path, mtime_ns)
+
+
+def load_forecast_manifest(data_type, engine=DEFAULT_ENGINE, root=FORECAST_FOLDER):
+    return load_manifest(os.path.join(forecast_folder(data_type, engine, root), FORECAST_MANIFEST))
+
+
+def forecast_entry(manifest, horizon=None, year=None):
+    """Entrada de uma previsão pelo horizonte (anos à frente) ou pelo ano previsto."""
+    for entry in manifest['forecasts']:
+        if (horizon is not None and entry['horizon'] == int(horizon)) or (year is not None and entry['year'] == str(year)):
+            return entry
+    raise KeyError(f"No forecast for horizon {horizon}" if horizon is not None else f"No forecast for year {year}")
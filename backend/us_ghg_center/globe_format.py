@@ -0,0 +1,81 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from .atomic_file import atomic_write
+
+# Formato binário colunar dos dados do globo (little-endian):
+#   header: magic b"GPGB", versão (uint8), codificação do valor (uint8), reservado (uint16), número de pontos (uint32)
+#   lat:    float32[count]
+#   lon:    float32[count]
+#   value:  uint16[count] (valor normalizado 0..1 quantizado em 0..65535) ou float32[count]
+# O header tem 12 bytes, então as colunas podem ser lidas direto com Float32Array/Uint16Array no navegador.
+MAGIC = b"GPGB"
+VERSION = 1
+VALUE_UINT16 = 0
+VALUE_FLOAT32 = 1
+HEADER = struct.Struct('<4sBBHI')
+MIME_TYPE = 'application/octet-stream'
+
+_UINT16_MAX = np.iinfo(np.uint16).max
+
+
+def binary_path_for(json_path):
+    return os.path.splitext(json_path)[0] + '.bin'
+
+
+def encode_globe_binary(lats, lons, values, value_encoding=VALUE_UINT16):
+    lats = np.asarray(lats, dtype='<f4')
+    lons = np.asarray(lons, dtype='<f4')
+    values = np.asarray(values, dtype=np.float64)
+
+    if value_encoding == VALUE_UINT16:
+        # NaN values can't be quantized; store them as 0
+        encoded = np.rint(np.nan_to_num(np.clip(values, 0, 1)) * _UINT16_MAX).astype('<u2')
+    else:
+        encoded = values.astype('<f4')
+
+    header = HEADER.pack(MAGIC, VERSION, value_encoding, 0, len(lats))
+    return b''.join([header, lats.tobytes(), lons.tobytes(), encoded.tobytes()])
+
+
+def decode_globe_binary(payload):
+    magic, version, value_encoding, _, count = HEADER.unpack_from(payload, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a globe binary file")
+
+    offset = HEADER.size
+    lats = np.frombuffer(payload, dtype='<f4', count=count, offset=offset)
+    offset += lats.nbytes
+    lons = np.frombuffer(payload, dtype='<f4', count=count, offset=offset)
+    offset += lons.nbytes
+    if value_encoding == VALUE_UINT16:
+        values = np.frombuffer(payload, dtype='<u2', count=count, offset=offset) / _UINT16_MAX
+    else:
+        values = np.frombuffer(payload, dtype='<f4', count=count, offset=offset)
+    return lats, lons, values
+
+
+def write_globe_binary(path, lats, lons, values, value_encoding=VALUE_UINT16):
+    # Temporário exclusivo: conversões simultâneas do mesmo arquivo não disputam o mesmo .tmp
+    atomic_write(path, encode_globe_binary(lats, lons, values, value_encoding))
+
+
+def read_globe_binary(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def json_to_binary(json_path, binary_path=None):
+    # Gera o .bin a partir de um JSON já existente (artefatos gerados antes do formato binário)
+    if binary_path is None:
+        binary_path = binary_path_for(json_path)
+    with open(json_path, 'r') as f:
+        points = json.load(f)
+    lats = [point['lat'] for point in points]
+    lons = [point['lon'] for point in points]
+    values = [point['value'] for point in points]
+    write_globe_binary(binary_path, lats, lons, values)
+    return binary_path
@@ -2,87 +2,299 @@ import rasterio
 import numpy as np
 import json
 import os
-import random
 import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .raster_io import read_decimated, valid_mask
+from .atomic_file import atomic_write, gzip_path_for, write_gzip_artifact
+from .globe_format import binary_path_for, json_to_binary, read_globe_binary, write_globe_binary
+from .data_cube import build_cube, load_cube_index
+from .tile_pyramid import build_pyramid_file, load_pyramid, pyramid_path_for, query_pyramid
+from .artifact_cache import ARTIFACT_CACHE
 
 # Variáveis de configuração
 RESOLUTION = 2  # Ajuste este valor para controlar a densidade dos pontosy
 MAX_POINTS = 100000  # Número máximo de pontos a serem processados
+RANDOM_SEED = 42  # Semente da amostragem, para que a saída seja reprodutível
+MAX_WORKERS = os.cpu_count() or 1  # Número de processos usados para processar os TIFs
+GLOBE_DATA_VERSION = 1  # Aumente ao mudar o cálculo ou o formato dos artefatos: invalida o cache
+ARTIFACT_KIND = "globe_data"
+
+
+def _sample_valid_indices(valid, max_points, seed):
+    # Sorted flat indices of (at most max_points) valid cells, without listing every valid cell
+    row_counts = np.count_nonzero(valid, axis=1)
+    n_valid = int(row_counts.sum())
+    if n_valid <= max_points:
+        return np.flatnonzero(valid)
+
+    rng = np.random.default_rng(seed)
+    ranks = np.sort(rng.choice(n_valid, size=max_points, replace=False))
+    row_ends = np.cumsum(row_counts)
+    rows = np.searchsorted(row_ends, ranks, side='right')
+    ranks_in_row = ranks - (row_ends - row_counts)[rows]
+
+    cols = np.empty_like(ranks)
+    unique_rows, starts = np.unique(rows, return_index=True)
+    stops = np.append(starts[1:], len(rows))
+    for row, start, stop in zip(unique_rows, starts, stops):
+        cols[start:stop] = np.flatnonzero(valid[row])[ranks_in_row[start:stop]]
+    return rows * valid.shape[1] + cols
+
+
+def _value_range(data, valid):
+    if np.issubdtype(data.dtype, np.floating):
+        info = np.finfo(data.dtype)
+    else:
+        info = np.iinfo(data.dtype)
+    data_min = np.min(data, where=valid, initial=info.max)
+    data_max = np.max(data, where=valid, initial=info.min)
+    return data_min, data_max
+
+
+def extract_arrays(data, max_points=MAX_POINTS, seed=RANDOM_SEED, nodata=None):
+    height, width = data.shape
+    lons = np.linspace(-180, 180, width)
+    lats = np.linspace(90, -90, height)
+
+    # Mask NaN/nodata cells without materializing a lat/lon grid
+    valid = valid_mask(data, nodata)
+
+    if not valid.any():
+        empty = np.empty(0)
+        return empty, empty, empty, np.nan, np.nan
+
+    data_min, data_max = _value_range(data, valid)
+
+    # Randomly sample cells if we have more than max_points, keeping row-major order
+    flat_idx = _sample_valid_indices(valid, max_points, seed)
+    rows, cols = np.divmod(flat_idx, width)
+    values = (data.ravel()[flat_idx] - data_min) / (data_max - data_min)
+    return lats[rows], lons[cols], values, data_min, data_max
 
 
-def preprocess_globe_data(tif_path, output_path, resolution=RESOLUTION, max_points=MAX_POINTS):
+def points_from_arrays(lats, lons, values):
+    return [
+        {'lat': lat, 'lon': lon, 'value': value}
+        for lat, lon, value in zip(lats.tolist(), lons.tolist(), values.tolist())
+    ]
+
+
+def extract_points(data, max_points=MAX_POINTS, seed=RANDOM_SEED, nodata=None):
+    lats, lons, values, data_min, data_max = extract_arrays(data, max_points, seed, nodata)
+    # Only build dicts for the points that are kept
+    return points_from_arrays(lats, lons, values), data_min, data_max
+
+
+def preprocess_globe_data(tif_path, output_path, resolution=RESOLUTION, max_points=MAX_POINTS, seed=RANDOM_SEED):
     print(f"Processing TIF file: {tif_path}")
     with rasterio.open(tif_path) as src:
-        data = src.read(1)[::resolution, ::resolution]
+        data = read_decimated(src, resolution)
+        nodata = src.nodata
         height, width = data.shape
 
     print(f"TIF dimensions after resolution adjustment: {height} x {width}")
 
-    lons = np.linspace(-180, 180, width)
-    lats = np.linspace(90, -90, height)
-    lon, lat = np.meshgrid(lons, lats)
-
-    # Normalize data
-    data_min = np.nanmin(data)
-    data_max = np.nanmax(data)
-    data_normalized = (data - data_min) / (data_max - data_min)
-
-    # Create a list of all valid points
-    all_points = []
-    for i in range(height):
-        for j in range(width):
-            if not np.isnan(data_normalized[i, j]):
-                all_points.append({
-                    'lat': float(lat[i, j]),
-                    'lon': float(lon[i, j]),
-                    'value': float(data_normalized[i, j])
-                })
-
-    # Randomly sample points if we have more than max_points
-    if len(all_points) > max_points:
-        points = random.sample(all_points, max_points)
-    else:
-        points = all_points
+    lats, lons, values, data_min, data_max = extract_arrays(data, max_points, seed, nodata)
+
+    # Save to JSON file, plus a gzip copy that can be served as-is. Both are replaced atomically: a forced rebuild
+    # runs while send_artifact is streaming these same files
+    body = json.dumps(points_from_arrays(lats, lons, values)).encode()
+    atomic_write(output_path, body)
+    write_gzip_artifact(output_path, body)
 
-    # Save to JSON file
-    with open(output_path, 'w') as f:
-        json.dump(points, f)
+    # Save the binary columnar version next to the JSON
+    binary_path = binary_path_for(output_path)
+    write_globe_binary(binary_path, lats, lons, values)
 
-    print(f"Processed {len(points)} points. Min value: {
-          data_min}, Max value: {data_max}")
+    print(f"Processed {len(values)} points. Min value: {data_min}, Max value: {data_max}")
     print(f"JSON file saved to: {output_path}")
+    print(f"Binary file saved to: {binary_path}")
+
+    # Multi-resolution pyramid for bbox/zoom queries
+    pyramid_path = pyramid_path_for(output_path)
+    with rasterio.open(tif_path) as src:
+        build_pyramid_file(src, pyramid_path)
+    print(f"Pyramid file saved to: {pyramid_path}")
+
+
+def tif_date(tif_file):
+    filename = os.path.basename(tif_file)
+    date_part = filename.split('_')[-1].split('.')[0]
+    return date_part[:4], date_part[4:]
+
+
+def processing_params(resolution=RESOLUTION, max_points=MAX_POINTS, seed=RANDOM_SEED):
+    return {'resolution': resolution, 'max_points': max_points, 'seed': seed}
+
 
+def artifact_paths(output_path):
+    return [output_path, gzip_path_for(output_path), binary_path_for(output_path), pyramid_path_for(output_path)]
 
-def process_all_tifs(tif_folder, output_folder):
+
+def artifact_outputs(output_path):
+    return {os.path.basename(path): path for path in artifact_paths(output_path)}
+
+
+def artifact_key(tif_file, params, cache=None):
+    # Conteúdo do TIF + parâmetros + versão do formato: qualquer mudança gera uma chave nova
+    return (cache or ARTIFACT_CACHE).key_for(ARTIFACT_KIND, [tif_file], params, GLOBE_DATA_VERSION)
+
+
+def _tif_outputs(tif_folder, output_folder):
+    for tif_file in sorted(glob.glob(os.path.join(tif_folder, "*.tif"))):
+        year, month = tif_date(tif_file)
+        yield tif_file, os.path.join(output_folder, f"globe_data_{year}_{month}.json")
+
+
+def find_stale_tifs(tif_folder, output_folder, params=None, cache=None):
+    # Lista de (TIF, JSON de saída, chave) cujos artefatos não correspondem à chave atual
+    cache = cache or ARTIFACT_CACHE
+    if params is None:
+        params = processing_params()
+
+    stale = []
+    for tif_file, output_path in _tif_outputs(tif_folder, output_folder):
+        key = artifact_key(tif_file, params, cache)
+        if not cache.is_fresh(key, artifact_outputs(output_path)):
+            stale.append((tif_file, output_path, key))
+    return stale
+
+
+class ProcessingCancelled(Exception):
+    pass
+
+
+def _process_tif(tif_file, output_path, params):
+    start = time.perf_counter()
+    preprocess_globe_data(tif_file, output_path, params['resolution'], params['max_points'], params['seed'])
+    return time.perf_counter() - start
+
+
+def process_all_tifs(tif_folder, output_folder, resolution=RESOLUTION, max_points=MAX_POINTS,
+                     seed=RANDOM_SEED, max_workers=MAX_WORKERS, force=False, progress=None, cancelled=None):
+    # progress(done, total, file=..., seconds=..., error=...), if given, is called as each stale file finishes.
+    # cancelled is an optional threading.Event: once set, pending files are skipped and ProcessingCancelled is raised.
     print(f"Searching for TIF files in: {tif_folder}")
-    tif_files = glob.glob(os.path.join(tif_folder, "*.tif"))
-    print(f"Found {len(tif_files)} TIF files")
 
     # Create output folder if it doesn't exist
     os.makedirs(output_folder, exist_ok=True)
     print(f"Output folder: {output_folder}")
 
-    for tif_file in tif_files:
-        print(f"Processing file: {tif_file}")
-        filename = os.path.basename(tif_file)
-        date_part = filename.split('_')[-1].split('.')[0]
-        year = date_part[:4]
-        month = date_part[4:]
+    params = processing_params(resolution, max_points, seed)
+    if force:
+        stale = [(tif_file, output_path, artifact_key(tif_file, params))
+                 for tif_file, output_path in _tif_outputs(tif_folder, output_folder)]
+    else:
+        stale = find_stale_tifs(tif_folder, output_folder, params)
+    print(f"Found {len(stale)} TIF files to (re)process")
+    if progress is not None:
+        progress(0, len(stale))
+
+    if not stale:
+        if load_cube_index(output_folder) is None:
+            update_data_cube(tif_folder, output_folder)
+        print("All outputs are up to date")
+        return
+
+    done = 0
+    processed = []
+    errors = {}
+
+    def record(tif_file, seconds=None, error=None):
+        nonlocal done
+        done += 1
+        if error is None:
+            processed.append(tif_file)
+            year, month = tif_date(tif_file)
+            print(f"Processed file for {year}-{month}")
+        else:
+            errors[tif_file] = str(error)
+            print(f"Error processing {tif_file}: {error}")
+        if progress is not None:
+            progress(done, len(stale), file=os.path.basename(tif_file), seconds=seconds,
+                     error=None if error is None else str(error))
+
+    def store(tif_file, output_path, key, seconds):
+        ARTIFACT_CACHE.store(key, ARTIFACT_KIND, artifact_outputs(output_path),
+                             {'inputs': [os.path.abspath(tif_file)], 'params': params, 'version': GLOBE_DATA_VERSION})
+        record(tif_file, seconds)
 
-        output_path = os.path.join(
-            output_folder, f"globe_data_{year}_{month}.json")
-        print(f"Output path: {output_path}")
-        preprocess_globe_data(tif_file, output_path)
-        print(f"Processed file for {year}-{month}")
+    def is_cancelled():
+        return cancelled is not None and cancelled.is_set()
 
+    # Artefatos já gerados antes para o mesmo conteúdo e parâmetros só são copiados de volta do cache
+    to_process = []
+    for tif_file, output_path, key in stale:
+        if not force and ARTIFACT_CACHE.lookup(key) is not None:
+            print(f"Reusing cached artifacts for {os.path.basename(tif_file)}")
+            ARTIFACT_CACHE.materialize(key, artifact_outputs(output_path))
+            record(tif_file, 0.0)
+        else:
+            ARTIFACT_CACHE.release(artifact_outputs(output_path))
+            to_process.append((tif_file, output_path, key))
+
+    if max_workers <= 1 or len(to_process) <= 1:
+        for tif_file, output_path, key in to_process:
+            if is_cancelled():
+                break
+            try:
+                store(tif_file, output_path, key, _process_tif(tif_file, output_path, params))
+            except Exception as e:
+                record(tif_file, error=e)
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(to_process))) as executor:
+            futures = {
+                executor.submit(_process_tif, tif_file, output_path, params): (tif_file, output_path, key)
+                for tif_file, output_path, key in to_process
+            }
+            for future in as_completed(futures):
+                if is_cancelled():
+                    # Files already running finish; the ones still queued are dropped
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                tif_file, output_path, key = futures[future]
+                try:
+                    store(tif_file, output_path, key, future.result())
+                except Exception as e:
+                    record(tif_file, error=e)
+
+    if processed:
+        update_data_cube(tif_folder, output_folder, processed)
+    if is_cancelled():
+        raise ProcessingCancelled(f"Cancelled after {done} of {len(stale)} files")
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(stale)} TIF files failed: {', '.join(sorted(errors))}")
     print("Finished processing all TIF files")
 
 
+def update_data_cube(tif_folder, output_folder, stale_tifs=None):
+    tif_dates = [(tif_file, *tif_date(tif_file)) for tif_file in sorted(glob.glob(os.path.join(tif_folder, "*.tif")))]
+    return build_cube(tif_dates, output_folder, stale_tifs)
+
+
 def get_globe_data(json_path):
     with open(json_path, 'r') as f:
         return json.load(f)
 
 
+def get_globe_data_binary(json_path):
+    binary_path = binary_path_for(json_path)
+    if not os.path.exists(binary_path):
+        # JSON generated before the binary format existed: convert it once
+        json_to_binary(json_path, binary_path)
+    return read_globe_binary(binary_path)
+
+
+def get_globe_cells(json_path, bbox=None, zoom=0):
+    pyramid_path = pyramid_path_for(json_path)
+    if not os.path.exists(pyramid_path):
+        raise FileNotFoundError(pyramid_path)
+    return query_pyramid(load_pyramid(pyramid_path), bbox, zoom)
+
+
 def get_available_years(json_folder):
     print(f"Searching for JSON files in: {json_folder}")
     if not os.path.exists(json_folder):
@@ -106,9 +318,6 @@ def get_available_years(json_folder):
 
 
 def check_json_files(tif_folder, json_folder):
-    tif_files = glob.glob(os.path.join(tif_folder, "*.tif"))
-    json_files = glob.glob(os.path.join(json_folder, "globe_data_*.json"))
-
-    return len(tif_files) == len(json_files)
+    return not find_stale_tifs(tif_folder, json_folder)
 
 # Adicione esta função ao final do arquivo
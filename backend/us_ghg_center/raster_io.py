@@ -0,0 +1,78 @@
+import math
+
+import numpy as np
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.windows import Window
+
+# Número máximo de pixels lidos por janela nas reduções em blocos (~64 MB em float32)
+BLOCK_PIXELS = 16 * 1024 * 1024
+
+
+def decimated_shape(src, resolution):
+    return math.ceil(src.height / resolution), math.ceil(src.width / resolution)
+
+
+def read_decimated(src, resolution=None, out_shape=None, band=1, resampling=Resampling.nearest):
+    # Lê a banda já reamostrada para out_shape: o GDAL usa as overviews internas quando existem
+    # e nunca aloca a banda inteira em resolução total
+    if out_shape is None:
+        out_shape = decimated_shape(src, resolution or 1)
+    if tuple(out_shape) == (src.height, src.width):
+        return src.read(band)
+
+    overviews = src.overviews(band)
+    if overviews:
+        print(f"Using internal overviews {overviews} for decimated read to {out_shape[0]} x {out_shape[1]}")
+    return src.read(band, out_shape=tuple(out_shape), resampling=resampling)
+
+
+def decimated_transform(src, out_shape):
+    return src.transform * Affine.scale(src.width / out_shape[1], src.height / out_shape[0])
+
+
+def iter_windows(src, band=1, max_pixels=BLOCK_PIXELS):
+    # Janelas de largura total alinhadas aos blocos internos do arquivo (tiles ou strips)
+    block_height = src.block_shapes[band - 1][0]
+    rows_per_window = max(block_height, (max_pixels // max(src.width, 1)) // block_height * block_height)
+    for row_off in range(0, src.height, rows_per_window):
+        yield Window(0, row_off, src.width, min(rows_per_window, src.height - row_off))
+
+
+def iter_blocks(src, band=1, max_pixels=BLOCK_PIXELS):
+    for window in iter_windows(src, band, max_pixels):
+        yield window, src.read(band, window=window)
+
+
+def valid_mask(data, nodata=None):
+    valid = ~np.isnan(data) if np.issubdtype(data.dtype, np.floating) else np.ones(data.shape, dtype=bool)
+    if nodata is not None and not np.isnan(nodata):
+        valid &= data != nodata
+    return valid
+
+
+def band_statistics(src, band=1, max_pixels=BLOCK_PIXELS):
+    # Min/max/soma/contagens da banda inteira, lida janela a janela
+    data_min = np.inf
+    data_max = -np.inf
+    total = 0.0
+    valid_count = 0
+    for _, block in iter_blocks(src, band, max_pixels):
+        valid = valid_mask(block, src.nodata)
+        count = int(np.count_nonzero(valid))
+        if count == 0:
+            continue
+        values = block[valid]
+        data_min = min(data_min, float(values.min()))
+        data_max = max(data_max, float(values.max()))
+        total += float(values.sum(dtype=np.float64))
+        valid_count += count
+
+    pixel_count = src.width * src.height
+    return {
+        'min': data_min if valid_count else None,
+        'max': data_max if valid_count else None,
+        'mean': total / valid_count if valid_count else None,
+        'valid_count': valid_count,
+        'nodata_count': pixel_count - valid_count,
+    }
@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from us_ghg_center.forecast_engines import BASELINE_ENGINES, get_forecaster
+from us_ghg_center.forecasts import DEFAULT_ENGINE, FORECAST_ENGINES
+
+
+def _forecaster(name):
+    if name == DEFAULT_ENGINE:
+        # Só importa o TensorFlow (via tif_predicter) quando o CNN-LSTM entra na comparação
+        from tif_predicter import get_forecaster as get_model_forecaster
+        return get_model_forecaster(name)
+    return get_forecaster(name)
+
+
+def score(actual, mean, lower=None, upper=None):
+    # Métricas por horizonte sobre os pixels com dado e previsão
+    error = mean.astype(np.float64) - actual
+    valid = np.isfinite(error)
+    result = {
+        'mae': np.array([np.mean(np.abs(e[v])) for e, v in zip(error, valid)]),
+        'rmse': np.array([np.sqrt(np.mean(e[v] ** 2)) for e, v in zip(error, valid)]),
+        'bias': np.array([np.mean(e[v]) for e, v in zip(error, valid)]),
+    }
+    if lower is not None:
+        inside = (actual >= lower) & (actual <= upper)
+        banded = valid & np.isfinite(lower) & np.isfinite(upper)
+        result['coverage'] = np.array([np.mean(i[b]) for i, b in zip(inside, banded)])
+    return result
+
+
+def backtest(stack, engines, holdout=3, interval=0.8):
+    """Ajusta cada motor sem os últimos holdout anos e compara a previsão com eles; devolve {motor: métricas}."""
+    train = stack[:-holdout]
+    actual = np.asarray(stack[-holdout:], dtype=np.float64)
+    results = {}
+    for name in engines:
+        forecaster = _forecaster(name)
+        start = time.perf_counter()
+        forecaster.fit(train)
+        fit_seconds = time.perf_counter() - start
+        mean, lower, upper = forecaster.forecast(holdout, interval)
+        forecast_seconds = time.perf_counter() - start - fit_seconds
+        results[name] = dict(score(actual, mean, lower, upper), fit=fit_seconds, forecast=forecast_seconds)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the forecast engines on held-out years")
+    parser.add_argument('stack', help="processed_stack.npy written by tif_predicter.py (years, height, width)")
+    parser.add_argument('--holdout', type=int, default=3, help="Last years left out of the fit and forecast")
+    parser.add_argument('--engines', default=','.join(BASELINE_ENGINES),
+                        help=f"Comma-separated engines ({', '.join(FORECAST_ENGINES)})")
+    parser.add_argument('--interval', type=float, default=0.8, help="Coverage of the uncertainty band")
+    args = parser.parse_args(argv)
+
+    engines = args.engines.split(',')
+    unknown = [name for name in engines if name not in FORECAST_ENGINES]
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(unknown)}")
+
+    stack = np.load(args.stack, mmap_mode='r')
+    print(f"Stack {stack.shape}: fitting on {len(stack) - args.holdout} years, testing on the last {args.holdout}")
+    results = backtest(stack, engines, args.holdout, args.interval)
+
+    print(f"\n{'engine':<22} {'fit (s)':>8} {'forecast (s)':>12} {'MAE':>10} {'RMSE':>10} {'bias':>10} "
+          f"{f'{args.interval:.0%} cov.':>9}")
+    for name, result in results.items():
+        coverage = f"{np.mean(result['coverage']):9.1%}" if 'coverage' in result else f"{'-':>9}"
+        print(f"{name:<22} {result['fit']:8.2f} {result['forecast']:12.2f} {np.mean(result['mae']):10.4g} "
+              f"{np.mean(result['rmse']):10.4g} {np.mean(result['bias']):10.3g} {coverage}")
+
+    print("\nMAE per horizon")
+    for name, result in results.items():
+        print(f"{name:<22} " + ' '.join(f"h{h}={value:.4g}" for h, value in enumerate(result['mae'], start=1)))
+
+
+if __name__ == '__main__':
+    main()
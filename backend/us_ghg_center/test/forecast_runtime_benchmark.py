@@ -0,0 +1,115 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import psutil
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from us_ghg_center.forecasts import MODEL_FOLDER, load_manifest, model_paths
+
+
+def _rss_mb():
+    return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+
+
+def _windows(manifest, shape, batch, seed=0):
+    # Janelas sintéticas na faixa dos dados de treino
+    low, high = manifest['normalization']['min'], manifest['normalization']['max']
+    return np.random.default_rng(seed).uniform(low, high, (batch, *shape)).astype(np.float32)
+
+
+def _run(backend, data_type, repeats, batch, model_folder=MODEL_FOLDER):
+    # Roda num processo novo: tempo de import e RSS não são contaminados pelo outro backend
+    start = time.perf_counter()
+    if backend == 'keras':
+        import tensorflow as tf
+        import_seconds = time.perf_counter() - start
+        model_path, manifest_path = model_paths(data_type, model_folder)
+        manifest = load_manifest(manifest_path)
+        model = tf.keras.models.load_model(model_path)
+        shape = model.input_shape[1:-1]
+
+        def predict(windows):
+            low, high = manifest['normalization']['min'], manifest['normalization']['max']
+            scale = (high - low) or 1
+            prediction = model.predict(((windows - low) / scale)[..., np.newaxis], verbose=0)
+            return prediction.reshape(windows.shape[0], *windows.shape[2:]) * scale + low
+    else:
+        from us_ghg_center.forecast_runtime import ForecastRuntime
+        import_seconds = time.perf_counter() - start
+        runtime = ForecastRuntime.load(data_type, model_folder)
+        manifest = load_manifest(model_paths(data_type, model_folder)[1])
+        shape = tuple(runtime.input['shape_signature'][1:-1])
+        predict = runtime.predict
+    load_seconds = time.perf_counter() - start - import_seconds
+
+    latencies = {}
+    outputs = {}
+    for size in (1, batch):
+        windows = _windows(manifest, shape, size)
+        outputs[size] = predict(windows)  # Primeira chamada (aquecimento) fora da medição
+        times = []
+        for _ in range(repeats):
+            call_start = time.perf_counter()
+            predict(windows)
+            times.append(time.perf_counter() - call_start)
+        latencies[size] = float(np.median(times))
+    return {'import': import_seconds, 'load': load_seconds, 'rss': _rss_mb(),
+            'latency': latencies, 'outputs': outputs}
+
+
+def _batched_requests(data_type, requests, model_folder=MODEL_FOLDER):
+    # Requisições concorrentes de uma janela cada, agrupadas pelo ForecastBatcher
+    from us_ghg_center.forecast_runtime import ForecastBatcher, ForecastRuntime
+    runtime = ForecastRuntime.load(data_type, model_folder)
+    manifest = load_manifest(model_paths(data_type, model_folder)[1])
+    windows = _windows(manifest, tuple(runtime.input['shape_signature'][1:-1]), requests)
+    batcher = ForecastBatcher(runtime)
+    batcher.predict(windows[0])
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=requests) as executor:
+        list(executor.map(batcher.predict, windows))
+    return time.perf_counter() - start, dict(batcher.stats)
+
+
+def main(argv=None):
+    # Importado aqui: os processos de medição reimportam este módulo e não devem carregar o runtime antes da hora
+    from us_ghg_center.forecast_runtime import MAX_BATCH
+
+    parser = argparse.ArgumentParser(description="Compare model.predict with the TFLite forecast runtime")
+    parser.add_argument('--type', default='natural', help="Dataset whose model is compared")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--model-folder', default=MODEL_FOLDER, help="Folder with the saved .keras/.tflite models")
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for backend in ('keras', 'tflite'):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[backend] = executor.submit(_run, backend, args.type, args.repeats, args.batch,
+                                               args.model_folder).result()
+
+    print(f"\n{'backend':<8} {'import (s)':>10} {'load (s)':>9} {'RSS (MB)':>9} "
+          f"{'1 window (ms)':>14} {f'{args.batch} windows (ms)':>15}")
+    for backend, result in results.items():
+        print(f"{backend:<8} {result['import']:10.2f} {result['load']:9.2f} {result['rss']:9.0f} "
+              f"{result['latency'][1] * 1000:14.1f} {result['latency'][args.batch] * 1000:15.1f}")
+    difference = max(float(np.max(np.abs(results['keras']['outputs'][size] - results['tflite']['outputs'][size])))
+                     for size in (1, args.batch))
+    print(f"\nMax |keras - tflite| = {difference:.3g}")
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        seconds, stats = executor.submit(_batched_requests, args.type, args.batch * 4,
+                                           args.model_folder).result()
+    print(f"{stats['requests'] - 1} concurrent requests through ForecastBatcher: {seconds * 1000:.1f} ms "
+          f"in {stats['batches'] - 1} model calls")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,13 @@ import numpy as np
 from rasterio.warp import transform_bounds
 import pyproj
 from datetime import datetime
+import os
+import sys
+
+# Adicione o diretório backend ao sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from us_ghg_center.raster_io import band_statistics
 
 
 def analyze_tif(tif_path):
@@ -32,6 +39,9 @@ def analyze_tif(tif_path):
             (0, min(100, height)), (0, min(100, width))))
         has_ocean = np.any(sample != src.nodata)
 
+        # Estatísticas da banda inteira, calculadas em janelas (sem carregar o raster todo)
+        statistics = band_statistics(src)
+
         # Verificar outros metadados relevantes
         metadata = src.tags()
 
@@ -62,6 +72,7 @@ def analyze_tif(tif_path):
             },
             "date_info": date_info,
             "has_ocean": has_ocean,
+            "statistics": statistics,
             "metadata": metadata,
             "coverage": coverage
         }
@@ -88,6 +99,10 @@ def print_tif_analysis(tif_path):
           'Sim' if info['has_ocean'] else 'Não ou indeterminado'}")
     print(f"Cobertura estimada: {info['coverage']}")
 
+    statistics = info['statistics']
+    print(f"Valores: mínimo {statistics['min']}, máximo {statistics['max']}, média {statistics['mean']}")
+    print(f"Pixels válidos: {statistics['valid_count']}, sem dados: {statistics['nodata_count']}")
+
     print("\nOutros metadados relevantes:")
     for key, value in info['metadata'].items():
         print(f"  {key}: {value}")
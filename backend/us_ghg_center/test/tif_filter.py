@@ -3,12 +3,19 @@ from rasterio.warp import calculate_default_transform, reproject, Resampling
 import numpy as np
 from scipy import ndimage
 import os
-from sklearn.preprocessing import MinMaxScaler
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-from cartopy.feature import COASTLINE, BORDERS
-from matplotlib.colors import LinearSegmentedColormap
+import time
+from concurrent.futures import ProcessPoolExecutor
 import psutil
+import sys
+
+# Adicione o diretório backend ao sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from us_ghg_center.atomic_file import atomic_path
+from us_ghg_center.raster_io import read_decimated, decimated_transform
+
+MAX_WORKERS = os.cpu_count() or 1  # Processos do modo em lote
+WARP_THREADS = os.cpu_count() or 1  # Threads do GDAL na reprojeção de um arquivo
 
 
 def print_memory_usage():
@@ -17,7 +24,53 @@ def print_memory_usage():
     print(f"Uso de memória: {memory_info.rss / 1024 / 1024:.2f} MB")
 
 
-def process_tiff(input_path, output_path, scale_factor, target_crs='EPSG:4326'):
+def reproject_in_memory(src, scale_factor, target_crs='EPSG:4326', num_threads=WARP_THREADS):
+    """Reprojeta a banda 1 já reduzida direto para um array float32, sem GeoTIFF intermediário."""
+    width = int(src.width * scale_factor)
+    height = int(src.height * scale_factor)
+
+    transform, _, _ = calculate_default_transform(
+        src.crs, target_crs, width, height, *src.bounds)
+
+    # Leitura já reduzida para o tamanho de saída, sem carregar a banda em resolução total
+    source = read_decimated(src, out_shape=(height, width), resampling=Resampling.average)
+    source_transform = decimated_transform(src, (height, width))
+    image = np.zeros((height, width), dtype=np.float32)
+    reproject(
+        source=source,
+        destination=image,
+        src_transform=source_transform,
+        src_nodata=src.nodata,
+        src_crs=src.crs,
+        dst_transform=transform,
+        dst_nodata=src.nodata,
+        dst_crs=target_crs,
+        resampling=Resampling.bilinear,
+        num_threads=num_threads)
+
+    kwargs = src.meta.copy()
+    kwargs.update({
+        'crs': target_crs,
+        'transform': transform,
+        'width': width,
+        'height': height,
+        'dtype': 'float32'
+    })
+    return image, kwargs
+
+
+def filter_image(image):
+    # 5-9. Processamento da imagem, em float32 e no próprio array
+    low, high = np.nanmin(image), np.nanmax(image)
+    image -= low  # Normalização min-max (como o MinMaxScaler: NaN ignorados, faixa nula vira divisão por 1)
+    image /= (high - low) or 1
+    np.sqrt(image, out=image)  # Linearização (potência 0.5)
+    image *= 1.1  # Correção atmosférica
+    ndimage.gaussian_filter(image, sigma=1, output=image)  # Krigagem
+    return image
+
+
+def process_tiff(input_path, output_path, scale_factor, target_crs='EPSG:4326', num_threads=WARP_THREADS):
     print("Iniciando pré-processamento do TIFF")
     print_memory_usage()
 
@@ -25,47 +78,16 @@ def process_tiff(input_path, output_path, scale_factor, target_crs='EPSG:4326'):
     results_dir = os.path.dirname(output_path)
     os.makedirs(results_dir, exist_ok=True)
 
-    # 1-4. Leitura, reprojeção, recorte e reamostragem
+    # 1-4. Leitura, reprojeção, recorte e reamostragem (em memória)
     with rasterio.open(input_path) as src:
-        width = int(src.width * scale_factor)
-        height = int(src.height * scale_factor)
-
-        transform, _, _ = calculate_default_transform(
-            src.crs, target_crs, width, height, *src.bounds)
-        kwargs = src.meta.copy()
-        kwargs.update({
-            'crs': target_crs,
-            'transform': transform,
-            'width': width,
-            'height': height
-        })
-
-        with rasterio.open(output_path, 'w', **kwargs) as dst:
-            reproject(
-                source=rasterio.band(src, 1),
-                destination=rasterio.band(dst, 1),
-                src_transform=src.transform,
-                src_crs=src.crs,
-                dst_transform=transform,
-                dst_crs=target_crs,
-                resampling=Resampling.bilinear)
-
-    # Leitura do arquivo reprojetado
-    with rasterio.open(output_path) as reprojected:
-        image = reprojected.read(1)
-
-    # 5-9. Processamento da imagem
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    image_normalized = scaler.fit_transform(
-        image.reshape(-1, 1)).reshape(image.shape)
-    image_linearized = np.power(image_normalized, 0.5)
-    image_segmented = np.where(image_linearized > 0.5, 1, 0)
-    image_atm_corrected = image_linearized * 1.1
-    image_kriged = ndimage.gaussian_filter(image_atm_corrected, sigma=1)
-
-    # Salvar a imagem processada
-    with rasterio.open(output_path, 'w', **kwargs) as dst:
-        dst.write(image_kriged, 1)
+        image, kwargs = reproject_in_memory(src, scale_factor, target_crs, num_threads)
+
+    filter_image(image)
+
+    # Salvar a imagem processada (uma única escrita, trocada de forma atômica)
+    with atomic_path(output_path, suffix='.tif') as tmp_path:
+        with rasterio.open(tmp_path, 'w', **kwargs) as dst:
+            dst.write(image, 1)
 
     print("Pré-processamento do TIFF concluído")
     print_memory_usage()
@@ -73,10 +95,29 @@ def process_tiff(input_path, output_path, scale_factor, target_crs='EPSG:4326'):
     return output_path, kwargs
 
 
+def _process_job(job):
+    input_path, output_path, scale_factor, target_crs, num_threads = job
+    start = time.perf_counter()
+    process_tiff(input_path, output_path, scale_factor, target_crs, num_threads)
+    return output_path, time.perf_counter() - start
+
+
+def process_tiffs(jobs, scale_factor, target_crs='EPSG:4326', max_workers=MAX_WORKERS):
+    """Processa [(entrada, saída), ...] num pool de processos; devolve [(saída, segundos)] na ordem dos jobs."""
+    workers = max(1, min(max_workers, len(jobs)))
+    # As threads de reprojeção são divididas entre os processos
+    num_threads = max(1, WARP_THREADS // workers)
+    tasks = [(input_path, output_path, scale_factor, target_crs, num_threads) for input_path, output_path in jobs]
+    if workers == 1:
+        return [_process_job(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_process_job, tasks))
+
+
 # Exemplo de uso da função
 if __name__ == "__main__":
     input_tiff = '../data/antropogenic/odiac2023_1km_excl_intl_200112.tif'
     output_tiff = 'results/processed_image.tif'
-    processed_tiff, metadata = process_tiff(input_tiff, output_tiff)
+    processed_tiff, metadata = process_tiff(input_tiff, output_tiff, scale_factor=0.1)
     print(f"Arquivo processado salvo em: {processed_tiff}")
     print("Metadata:", metadata)
\ No newline at end of file
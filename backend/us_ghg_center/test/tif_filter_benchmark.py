@@ -0,0 +1,114 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio.warp import calculate_default_transform, reproject, Resampling
+from scipy import ndimage
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from tif_filter import MAX_WORKERS, process_tiff, process_tiffs
+from us_ghg_center.raster_io import read_decimated, decimated_transform
+
+
+def legacy_process_tiff(input_path, output_path, scale_factor, target_crs='EPSG:4326'):
+    # Caminho anterior: GeoTIFF reprojetado em disco, relido, processado em float64 e reescrito
+    # (o MinMaxScaler foi trocado pelo cálculo equivalente em numpy para não depender do sklearn)
+    with rasterio.open(input_path) as src:
+        width = int(src.width * scale_factor)
+        height = int(src.height * scale_factor)
+        transform, _, _ = calculate_default_transform(src.crs, target_crs, width, height, *src.bounds)
+        source = read_decimated(src, out_shape=(height, width), resampling=Resampling.average)
+        source_transform = decimated_transform(src, (height, width))
+        kwargs = src.meta.copy()
+        kwargs.update({'crs': target_crs, 'transform': transform, 'width': width, 'height': height})
+        with rasterio.open(output_path, 'w', **kwargs) as dst:
+            reproject(source=source, destination=rasterio.band(dst, 1), src_transform=source_transform,
+                      src_nodata=src.nodata, src_crs=src.crs, dst_transform=transform, dst_crs=target_crs,
+                      resampling=Resampling.bilinear)
+
+    with rasterio.open(output_path) as reprojected:
+        image = reprojected.read(1)
+
+    column = image.reshape(-1, 1).astype(np.float64)
+    low, high = np.nanmin(column), np.nanmax(column)
+    image_normalized = ((column - low) / ((high - low) or 1)).reshape(image.shape)
+    image_linearized = np.power(image_normalized, 0.5)
+    image_segmented = np.where(image_linearized > 0.5, 1, 0)
+    image_atm_corrected = image_linearized * 1.1
+    image_kriged = ndimage.gaussian_filter(image_atm_corrected, sigma=1)
+    del image_segmented
+
+    with rasterio.open(output_path, 'w', **kwargs) as dst:
+        dst.write(image_kriged, 1)
+    return output_path, kwargs
+
+
+def _peak_rss_mb():
+    # ru_maxrss em KB no Linux; no modo em lote o pico é o do maior processo do pool
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+def _run(mode, input_files, output_dir, scale_factor, workers):
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(input_file, os.path.join(output_dir, f"processed_{os.path.basename(input_file)}"))
+            for input_file in input_files]
+    start = time.perf_counter()
+    if mode == 'batch':
+        latencies = [seconds for _, seconds in process_tiffs(jobs, scale_factor, max_workers=workers)]
+    else:
+        function = legacy_process_tiff if mode == 'legacy' else process_tiff
+        latencies = []
+        for input_file, output_file in jobs:
+            file_start = time.perf_counter()
+            function(input_file, output_file, scale_factor)
+            latencies.append(time.perf_counter() - file_start)
+    return time.perf_counter() - start, latencies, _peak_rss_mb()
+
+
+def _max_difference(first_dir, second_dir):
+    difference = 0.0
+    for path in glob.glob(os.path.join(first_dir, "*.tif")):
+        with rasterio.open(path) as a, rasterio.open(os.path.join(second_dir, os.path.basename(path))) as b:
+            difference = max(difference, float(np.nanmax(np.abs(a.read(1).astype(np.float64) - b.read(1)))))
+    return difference
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-file latency and peak RSS of tif_filter.process_tiff")
+    parser.add_argument('inputs', nargs='+', help="Input TIFs (globs are expanded)")
+    parser.add_argument('--scale-factor', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help="Processes in batch mode")
+    parser.add_argument('--modes', default='legacy,memory,batch')
+    args = parser.parse_args(argv)
+
+    input_files = sorted(path for pattern in args.inputs for path in glob.glob(pattern))
+    output_root = tempfile.mkdtemp(prefix="tif_filter_benchmark_")
+    print(f"{len(input_files)} files, scale factor {args.scale_factor}, outputs in {output_root}")
+
+    results = {}
+    for mode in args.modes.split(','):
+        # Cada modo roda num processo novo: o pico de RSS de um não contamina o do outro
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results[mode] = executor.submit(_run, mode, input_files, os.path.join(output_root, mode),
+                                            args.scale_factor, args.workers).result()
+
+    print(f"\n{'mode':<8} {'wall (s)':>9} {'median/file (ms)':>17} {'max/file (ms)':>14} {'peak RSS (MB)':>14}")
+    for mode, (wall, latencies, peak) in results.items():
+        print(f"{mode:<8} {wall:9.2f} {np.median(latencies) * 1000:17.0f} {max(latencies) * 1000:14.0f} {peak:14.0f}")
+    if 'legacy' in results and 'memory' in results:
+        difference = _max_difference(os.path.join(output_root, 'legacy'), os.path.join(output_root, 'memory'))
+        print(f"\nMax |legacy - memory| = {difference:.3g}")
+
+
+if __name__ == '__main__':
+    main()
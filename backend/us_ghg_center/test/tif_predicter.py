@@ -4,11 +4,23 @@ import cartopy.crs as ccrs
 import os
 import numpy as np
 import rasterio
+import tensorflow as tf
+from numpy.lib.stride_tricks import sliding_window_view
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, LSTM, TimeDistributed, BatchNormalization, Dropout
 from sklearn.model_selection import train_test_split
 from tif_filter import process_tiff
+from us_ghg_center.artifact_cache import ARTIFACT_CACHE
+from us_ghg_center.atomic_file import atomic_path, atomic_write
+from us_ghg_center.forecast_engines import BASELINE_ENGINES
+from us_ghg_center.forecast_engines import get_forecaster as get_baseline_forecaster
+from us_ghg_center.forecasts import (DEFAULT_ENGINE, FORECAST_BANDS, FORECAST_MANIFEST, forecast_folder,
+                                     forecast_json_path, forecast_tif_path, load_manifest, model_paths,
+                                     write_manifest)
+from us_ghg_center.forecast_runtime import MAX_BATCH, tflite_path
+from us_ghg_center.plot3d_v1 import artifact_outputs, preprocess_globe_data, processing_params, tif_date
 import psutil
+import time
 from tensorflow.keras.callbacks import EarlyStopping
 
 # Model and data processing parameters
@@ -22,6 +34,15 @@ BATCH_SIZE = 4  # Batch size for training
 VALIDATION_SPLIT = 0.2  # Fraction of data to use for validation
 TIME_STEPS = 5  # Number of time steps (years) to use for prediction
 EARLY_STOPPING_PATIENCE = 10  # Patience for early stopping
+PROCESSED_TIFF_VERSION = 2  # Bump when process_tiff changes: cached processed TIFFs are then rebuilt
+STACK_NAME = 'processed_stack.npy'  # float32 memmap (years, height, width) with every processed year
+SHUFFLE_SEED = 42  # Seed for the train/validation split and the per-epoch shuffle
+FORECAST_HORIZONS = 3  # Years ahead precomputed for /api/prediction (each step feeds the next one)
+FORECAST_UNTIL_YEAR = 2050  # Baseline engines are cheap enough to forecast up to this year
+FORECAST_INTERVAL = 0.8  # Coverage of the uncertainty band saved with the baseline forecasts
+MODEL_VERSION = 1  # Bump when the model or the training pipeline changes: the saved model is then retrained
+FORECAST_VERSION = 1  # Bump when the forecast files change: forecasts are then recomputed
+TFLITE_VERSION = 2  # Bump when the TFLite export changes: the exported model is then rebuilt
 
 
 def print_memory_usage(message):
@@ -30,42 +51,76 @@ def print_memory_usage(message):
     print(f"{message} - Uso de memória: {memory_info.rss / 1024 / 1024:.2f} MB")
 
 
-def process_multiple_tiffs(input_files, output_dir):
-    processed_data = []
-    for input_file in input_files:
-        output_file = os.path.join(output_dir, f"processed_{os.path.basename(input_file)}")
-        
-        if os.path.exists(output_file):
-            print(f"Processed file already exists: {output_file}")
+def process_multiple_tiffs(input_files, output_dir, stack_path=None):
+    """Processes each TIFF and writes it into one float32 memmap (years, height, width); returns it read-only."""
+    stack_path = stack_path or os.path.join(output_dir, STACK_NAME)
+    stack = None
+    with atomic_path(stack_path, suffix='.npy') as tmp_path:
+        for year, input_file in enumerate(input_files):
+            output_file = os.path.join(output_dir, f"processed_{os.path.basename(input_file)}")
+
+            # Reused only if it was produced from the same input content with the same parameters
+            _, status = ARTIFACT_CACHE.get_or_create(
+                'processed_tiff', {os.path.basename(output_file): output_file},
+                lambda: process_tiff(input_file, output_file, scale_factor=SCALE_FACTOR),
+                inputs=[input_file], params={'scale_factor': SCALE_FACTOR, 'target_crs': 'EPSG:4326'},
+                version=PROCESSED_TIFF_VERSION)
+            print(f"Processed file {output_file} ({status})")
             with rasterio.open(output_file) as src:
-                data = src.read(1)
-        else:
-            print(f"Processing file: {input_file}")
-            processed_file, _ = process_tiff(input_file, output_file, scale_factor=SCALE_FACTOR)
-            with rasterio.open(processed_file) as src:
-                data = src.read(1)
-        
-        processed_data.append(data)
-    
+                if stack is None:
+                    stack = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                                      shape=(len(input_files), src.height, src.width))
+                # Written year by year: only one raster is in RAM at a time
+                stack[year] = src.read(1, out_dtype=np.float32)
+
+        stack.flush()
+        del stack
     print_memory_usage("Após processar todos os TIFFs")
-    return np.array(processed_data)
+    return np.load(stack_path, mmap_mode='r')
+
+
+def normalization_stats(data):
+    # Streaming pass: min/max accumulated one year at a time, without loading the whole stack
+    lo, hi = np.inf, -np.inf
+    for year in range(len(data)):
+        lo = min(lo, float(np.nanmin(data[year])))
+        hi = max(hi, float(np.nanmax(data[year])))
+    return {'min': lo, 'max': hi}
+
 
+def normalize_data(data, stats):
+    scale = stats['max'] - stats['min']
+    return ((np.asarray(data, dtype=np.float32) - stats['min']) / (scale if scale else 1)).astype(np.float32)
 
-def normalize_data(data):
-    return (data - np.min(data)) / (np.max(data) - np.min(data))
+
+def denormalize_data(data, stats):
+    return data * (stats['max'] - stats['min']) + stats['min']
 
 
 def prepare_data_for_cnn_lstm(data, time_steps):
-    X = []
-    y = []
-    for i in range(len(data) - time_steps):
-        X.append(data[i:i+time_steps])
-        y.append(data[i+time_steps])
-    X = normalize_data(np.array(X))[..., np.newaxis]
-    y = normalize_data(np.array(y))[..., np.newaxis]
+    # Zero-copy views: X[i] = data[i:i+time_steps] (sliding window strides), y[i] = data[i+time_steps]
+    windows = sliding_window_view(data, time_steps, axis=0)  # (n - time_steps + 1, height, width, time_steps)
+    X = np.moveaxis(windows, -1, 1)[:-1]
+    y = data[time_steps:]
     return X, y
 
 
+def make_dataset(X, y, indices, stats, shuffle=False):
+    """tf.data pipeline that reads one window at a time from the memmap and normalizes it on the fly."""
+    time_steps, height, width = X.shape[1:]
+    rng = np.random.default_rng(SHUFFLE_SEED)
+
+    def generator():
+        order = rng.permutation(indices) if shuffle else indices
+        for i in order:
+            yield normalize_data(X[i], stats)[..., np.newaxis], normalize_data(y[i], stats).reshape(-1)
+
+    dataset = tf.data.Dataset.from_generator(generator, output_signature=(
+        tf.TensorSpec(shape=(time_steps, height, width, 1), dtype=tf.float32),
+        tf.TensorSpec(shape=(height * width,), dtype=tf.float32)))
+    return dataset.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+
 def create_cnn_lstm_model(input_shape, time_steps):
     model = Sequential([
         TimeDistributed(Conv2D(CONV_FILTERS[0], (3, 3), activation='relu', padding='same'), input_shape=(time_steps, *input_shape)),
@@ -84,29 +139,30 @@ def create_cnn_lstm_model(input_shape, time_steps):
         Dropout(DROPOUT_RATE),
         Dense(DENSE_NEURONS[1], activation='relu'),
         Dropout(DROPOUT_RATE),
-        Dense(np.prod(input_shape), activation='linear')
+        Dense(int(np.prod(input_shape)), activation='linear')
     ])
     model.compile(optimizer='adam', loss='mse')
     return model
 
 
-def train_model(X, y):
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=VALIDATION_SPLIT, random_state=42)
-    input_shape = X_train.shape[2:]  # Exclude time_steps and batch dimensions
-    time_steps = X_train.shape[1]
+def train_model(X, y, stats):
+    train_indices, val_indices = train_test_split(
+        np.arange(len(X)), test_size=VALIDATION_SPLIT, random_state=SHUFFLE_SEED)
+    input_shape = (*X.shape[2:], 1)  # Exclude time_steps and batch dimensions
+    time_steps = X.shape[1]
     model = create_cnn_lstm_model(input_shape, time_steps)
     early_stopping = EarlyStopping(patience=EARLY_STOPPING_PATIENCE, restore_best_weights=True)
-    model.fit(X_train, y_train.reshape(y_train.shape[0], -1),
-              validation_data=(X_val, y_val.reshape(y_val.shape[0], -1)),
-              epochs=EPOCHS, batch_size=BATCH_SIZE, callbacks=[early_stopping])
+    model.fit(make_dataset(X, y, train_indices, stats, shuffle=True),
+              validation_data=make_dataset(X, y, val_indices, stats),
+              epochs=EPOCHS, callbacks=[early_stopping])
     return model
 
 
-def predict_future(model, last_years_data):
-    last_years_data = last_years_data[np.newaxis, ..., np.newaxis]
+def predict_future(model, last_years_data, stats):
+    # Same normalization as training; the prediction is returned in data units
+    last_years_data = normalize_data(last_years_data, stats)[np.newaxis, ..., np.newaxis]
     prediction = model.predict(last_years_data)
-    return prediction.reshape(last_years_data.shape[2:4])  # Reshape to match image dimensions
+    return denormalize_data(prediction.reshape(last_years_data.shape[2:4]), stats)  # Reshape to match image dimensions
 
 
 def save_prediction(prediction, output_path, metadata):
@@ -118,6 +174,192 @@ def save_prediction(prediction, output_path, metadata):
         dst.write(prediction, 1)
 
 
+def hyperparameters():
+    # Everything that changes the trained model; part of the model's cache key and manifest
+    return {
+        'scale_factor': SCALE_FACTOR, 'conv_filters': CONV_FILTERS, 'dense_neurons': DENSE_NEURONS,
+        'lstm_units': LSTM_UNITS, 'dropout_rate': DROPOUT_RATE, 'epochs': EPOCHS, 'batch_size': BATCH_SIZE,
+        'validation_split': VALIDATION_SPLIT, 'time_steps': TIME_STEPS,
+        'early_stopping_patience': EARLY_STOPPING_PATIENCE, 'shuffle_seed': SHUFFLE_SEED,
+    }
+
+
+def input_entries(input_files):
+    return [{'file': os.path.basename(path), 'sha256': ARTIFACT_CACHE.input_hash(path)} for path in input_files]
+
+
+def train_or_load_model(input_files, processed_data, data_type):
+    """Trains only when the input TIFs or the hyperparameters changed; returns (key, manifest, get_model)."""
+    model_path, manifest_path = model_paths(data_type)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    params = hyperparameters()
+    key = ARTIFACT_CACHE.key_for('cnn_lstm_model', input_files, params, MODEL_VERSION)
+    trained = []
+
+    def produce():
+        stats = normalization_stats(processed_data)
+        X, y = prepare_data_for_cnn_lstm(processed_data, TIME_STEPS)
+        model = train_model(X, y, stats)
+        model.save(model_path)
+        write_manifest(manifest_path, {
+            'key': key,
+            'data_type': data_type,
+            'inputs': input_entries(input_files),
+            'hyperparameters': params,
+            'version': MODEL_VERSION,
+            'normalization': stats,
+            'last_year': tif_date(input_files[-1])[0],
+            'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+        trained.append(model)
+
+    _, status = ARTIFACT_CACHE.get_or_create(
+        'cnn_lstm_model', {os.path.basename(model_path): model_path, os.path.basename(manifest_path): manifest_path},
+        produce, inputs=input_files, params=params, version=MODEL_VERSION, key=key)
+    print(f"Model {model_path} ({status})")
+
+    def get_model():
+        # The saved model is only loaded when something actually needs it
+        if not trained:
+            trained.append(tf.keras.models.load_model(model_path))
+        return trained[0]
+
+    return key, load_manifest(manifest_path), get_model
+
+
+def export_tflite(model, output_path, batch_size=MAX_BATCH):
+    # Static batch of MAX_BATCH windows: the LSTM only lowers to builtin TFLite ops with static shapes,
+    # and XNNPack can't resize it afterwards. The runtime pads smaller batches up to this size
+    inputs = tf.keras.Input(batch_shape=(batch_size, *model.input_shape[1:]))
+    converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.Model(inputs, model(inputs, training=False)))
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+    return atomic_write(output_path, converter.convert())
+
+
+def export_model(model_key, get_model, data_type):
+    """TFLite copy of the trained model for us_ghg_center.forecast_runtime (no TensorFlow needed to run it)."""
+    output_path = tflite_path(data_type)
+    _, status = ARTIFACT_CACHE.get_or_create(
+        'cnn_lstm_tflite', {os.path.basename(output_path): output_path},
+        lambda: export_tflite(get_model(), output_path),
+        params={'model': model_key}, version=TFLITE_VERSION)
+    print(f"TFLite model {output_path} ({status})")
+    return output_path
+
+
+def forecast_horizons(model, last_years_data, stats, horizons=FORECAST_HORIZONS):
+    # Recursive forecast: each predicted year replaces the oldest one in the input window
+    window = np.array(last_years_data, dtype=np.float32)
+    predictions = []
+    for _ in range(horizons):
+        prediction = predict_future(model, window, stats).astype(np.float32)
+        predictions.append(prediction)
+        window = np.concatenate([window[1:], prediction[np.newaxis]])
+    return predictions
+
+
+class CnnLstmForecaster:
+    """CNN-LSTM behind the same interface as the baseline engines in us_ghg_center.forecast_engines.
+
+    With get_model/stats it reuses a trained model; otherwise fit() trains one on the given stack.
+    """
+
+    supports_intervals = False
+
+    def __init__(self, get_model=None, stats=None):
+        self.get_model = get_model
+        self.stats = stats
+
+    def options(self):
+        return hyperparameters()
+
+    def fit(self, stack):
+        self.window = np.array(stack[-TIME_STEPS:], dtype=np.float32)
+        if self.get_model is None:
+            self.stats = normalization_stats(stack)
+            X, y = prepare_data_for_cnn_lstm(stack, TIME_STEPS)
+            model = train_model(X, y, self.stats)
+            self.get_model = lambda: model
+        return self
+
+    def forecast(self, horizons, interval=None):
+        return np.stack(forecast_horizons(self.get_model(), self.window, self.stats, horizons)), None, None
+
+
+def get_forecaster(name, **options):
+    """Forecast engine by name: 'cnn_lstm' or one of the baseline engines."""
+    if name == DEFAULT_ENGINE:
+        return CnnLstmForecaster(**options)
+    return get_baseline_forecaster(name, **options)
+
+
+def precompute_forecasts(data_type, engine, key, forecaster, processed_data, metadata, details,
+                         horizons=FORECAST_HORIZONS, interval=None):
+    """Forecast rasters and their globe JSON/binary artifacts, recomputed only when the engine's key changes.
+
+    details (inputs, options, fitted_at, last_year) goes into the forecast manifest read by /api/prediction.
+    """
+    folder = forecast_folder(data_type, engine)
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, FORECAST_MANIFEST)
+    if interval is None or not forecaster.supports_intervals:
+        interval = None
+    bands = FORECAST_BANDS if interval is not None else ('mean',)
+    outputs = {FORECAST_MANIFEST: manifest_path}
+    for horizon in range(1, horizons + 1):
+        for band in bands:
+            outputs[os.path.basename(forecast_tif_path(folder, horizon, band))] = forecast_tif_path(folder, horizon, band)
+            outputs.update(artifact_outputs(forecast_json_path(folder, horizon, band)))
+
+    def produce():
+        forecasts = dict(zip(FORECAST_BANDS, forecaster.fit(processed_data).forecast(horizons, interval)))
+        entries = []
+        for horizon in range(1, horizons + 1):
+            for band in bands:
+                tif_path = forecast_tif_path(folder, horizon, band)
+                save_prediction(forecasts[band][horizon - 1], tif_path, dict(metadata, dtype='float32'))
+                preprocess_globe_data(tif_path, forecast_json_path(folder, horizon, band))
+            entry = {'horizon': horizon, 'year': str(int(details['last_year']) + horizon),
+                     'json': os.path.basename(forecast_json_path(folder, horizon)),
+                     'tif': os.path.basename(forecast_tif_path(folder, horizon))}
+            if interval is not None:
+                entry['bands'] = {band: os.path.basename(forecast_json_path(folder, horizon, band))
+                                  for band in bands if band != 'mean'}
+            entries.append(entry)
+        write_manifest(manifest_path, dict(details, data_type=data_type, engine=engine, key=key,
+                                           interval=interval, forecasts=entries))
+
+    _, status = ARTIFACT_CACHE.get_or_create(
+        'forecast', outputs, produce, inputs=(),
+        params={'engine': engine, 'key': key, 'horizons': horizons, 'interval': interval,
+                'globe': processing_params()},
+        version=FORECAST_VERSION)
+    print(f"Forecasts in {folder} ({status})")
+    return manifest_path
+
+
+def precompute_model_forecasts(data_type, model_key, manifest, get_model, processed_data, metadata,
+                               horizons=FORECAST_HORIZONS):
+    forecaster = CnnLstmForecaster(get_model, manifest['normalization'])
+    details = {'inputs': manifest['inputs'], 'options': manifest['hyperparameters'],
+               'fitted_at': manifest['trained_at'], 'last_year': manifest['last_year']}
+    return precompute_forecasts(data_type, DEFAULT_ENGINE, model_key, forecaster, processed_data, metadata, details,
+                                horizons)
+
+
+def precompute_baseline_forecasts(data_type, engine, input_files, processed_data, metadata,
+                                  until_year=FORECAST_UNTIL_YEAR, interval=FORECAST_INTERVAL):
+    """Baseline engine forecasts up to until_year; fitted in seconds, so no model is saved."""
+    forecaster = get_baseline_forecaster(engine)
+    options = dict(forecaster.options(), scale_factor=SCALE_FACTOR)
+    key = ARTIFACT_CACHE.key_for('baseline_forecaster', input_files, options, FORECAST_VERSION)
+    last_year = tif_date(input_files[-1])[0]
+    details = {'inputs': input_entries(input_files), 'options': options,
+               'fitted_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'last_year': last_year}
+    return precompute_forecasts(data_type, engine, key, forecaster, processed_data, metadata, details,
+                                until_year - int(last_year), interval)
+
+
 def plot_world_map(last_processed, prediction, output_path):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 10),
                                    subplot_kw={'projection': ccrs.PlateCarree()})
@@ -237,46 +479,44 @@ if __name__ == "__main__":
     ]
     
     
+    DATA_TYPE = 'natural'  # Dataset of the input files above ('anthropogenic' for the ODIAC list)
     output_dir = 'processed_tiffs'
     os.makedirs(output_dir, exist_ok=True)
 
-    # Check if all processed files exist
-    all_processed = all(os.path.exists(os.path.join(output_dir, f"processed_{os.path.basename(f)}")) for f in input_files)
-
-    if all_processed:
-        print("All files are already processed. Skipping processing step.")
-        processed_data = process_multiple_tiffs(input_files, output_dir)
-    else:
-        print("Processing TIFF files...")
-        processed_data = process_multiple_tiffs(input_files, output_dir)
-
-    # Prepare data for the CNN-LSTM
-    print("Preparing data for the CNN-LSTM...")
-    X, y = prepare_data_for_cnn_lstm(processed_data, TIME_STEPS)
-    print_memory_usage("After preparing data for CNN-LSTM")
-
-    # Train the model
-    print("Training the CNN-LSTM model...")
-    model = train_model(X, y)
-
-    # Make the prediction for 2025
-    print("Making the prediction for 2025...")
-    prediction_2025 = predict_future(model, processed_data[-TIME_STEPS:])
-    print_memory_usage("After making the prediction")
-
-    # Salvar a previsão como TIFF
-    print("Salvando a previsão como TIFF...")
-    with rasterio.open(input_files[-1]) as src:
-        metadata = src.meta.copy()
-    save_prediction(prediction_2025, 'prediction_2025.tif', metadata)
+    # Processed files are reused through the artifact cache when inputs and parameters are unchanged
+    print("Processing TIFF files...")
+    processed_data = process_multiple_tiffs(input_files, output_dir)
+
+    # Train the model, or reuse the saved one when inputs and hyperparameters are unchanged
+    print("Training (or loading) the CNN-LSTM model...")
+    model_key, manifest, get_model = train_or_load_model(input_files, processed_data, DATA_TYPE)
+    export_model(model_key, get_model, DATA_TYPE)
+    print_memory_usage("After training the CNN-LSTM")
 
-    # Ler o TIFF original de 2020
-    original_2020, _ = read_tiff(input_files[-1])
+    # Precompute the forecasts served by /api/prediction
+    print(f"Precomputing forecasts for the next {FORECAST_HORIZONS} years...")
+    with rasterio.open(os.path.join(output_dir, f"processed_{os.path.basename(input_files[-1])}")) as src:
+        metadata = src.meta.copy()
+    forecast_manifest_path = precompute_model_forecasts(DATA_TYPE, model_key, manifest, get_model, processed_data,
+                                                        metadata)
+    forecast_manifest = load_manifest(forecast_manifest_path)
+    last_forecast = forecast_manifest['forecasts'][-1]
+    print_memory_usage("After precomputing the forecasts")
+    prediction, _ = read_tiff(os.path.join(forecast_folder(DATA_TYPE), last_forecast['tif']))
+
+    # Baseline engines (per-pixel trends, no model) up to FORECAST_UNTIL_YEAR, with uncertainty bands
+    for engine in BASELINE_ENGINES:
+        print(f"Precomputing {engine} forecasts up to {FORECAST_UNTIL_YEAR}...")
+        precompute_baseline_forecasts(DATA_TYPE, engine, input_files, processed_data, metadata)
+    print_memory_usage("After precomputing the baseline forecasts")
+
+    # Ler o TIFF original do último ano
+    original, _ = read_tiff(input_files[-1])
 
     # Plotar a comparação
     print("Gerando o mapa comparativo...")
     plot_comparison(
-        original_2020, processed_data[-1], prediction_2025, 'comparison_original_processed_prediction.png')
+        original, processed_data[-1], prediction, 'comparison_original_processed_prediction.png')
 
-    print("Processamento concluído. Arquivos gerados: prediction_2025.tif e comparison_original_processed_prediction.png")
-    print_memory_usage("Fim do script")
\ No newline at end of file
+    print(f"Processamento concluído. Previsões em {forecast_folder(DATA_TYPE)}; mapa em comparison_original_processed_prediction.png")
+    print_memory_usage("Fim do script")
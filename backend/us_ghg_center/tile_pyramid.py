@@ -0,0 +1,179 @@
+import os
+import struct
+import warnings
+import zipfile
+from functools import lru_cache
+
+import numpy as np
+from rasterio.enums import Resampling
+
+from .atomic_file import atomic_path
+from .raster_io import read_decimated, valid_mask
+
+# Pirâmide multi-resolução dos dados do globo
+PYRAMID_BASE_WIDTH = 3600  # Largura máxima do nível mais detalhado (0.1° em uma grade global)
+PYRAMID_MIN_WIDTH = 200  # O nível mais grosso tem pelo menos esta largura
+PYRAMID_MAX_CELLS = 100000  # Número máximo de células devolvidas por consulta
+PYRAMID_CACHE_SIZE = 64  # Pirâmides mapeadas (só o mapeamento; os dados ficam no page cache compartilhado)
+
+
+def pyramid_path_for(json_path):
+    folder, filename = os.path.split(json_path)
+    name = os.path.splitext(filename)[0].replace('globe_data_', 'pyramid_', 1)
+    return os.path.join(folder, f"{name}.npz")
+
+
+def _read_level(src, out_shape, resampling):
+    data = read_decimated(src, out_shape=out_shape, resampling=resampling).astype(np.float32, copy=False)
+    data[~valid_mask(data, src.nodata)] = np.nan
+    return data
+
+
+def _downsample(mean, maximum):
+    # Média e máximo em blocos 2x2, ignorando células sem dado
+    height, width = mean.shape
+    pad = ((0, height % 2), (0, width % 2))
+    mean = np.pad(mean, pad, constant_values=np.nan)
+    maximum = np.pad(maximum, pad, constant_values=np.nan)
+    shape = (mean.shape[0] // 2, 2, mean.shape[1] // 2, 2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        return (np.nanmean(mean.reshape(shape), axis=(1, 3)),
+                np.nanmax(maximum.reshape(shape), axis=(1, 3)))
+
+
+def build_pyramid(src, base_width=PYRAMID_BASE_WIDTH, min_width=PYRAMID_MIN_WIDTH):
+    width = min(src.width, base_width)
+    height = max(1, round(src.height * width / src.width))
+
+    # Média preserva o total, máximo preserva os focos de emissão ao reduzir a resolução
+    mean = _read_level(src, (height, width), Resampling.average)
+    maximum = _read_level(src, (height, width), Resampling.max)
+    levels = [(mean, maximum)]
+    while mean.shape[1] // 2 >= min_width:
+        mean, maximum = _downsample(mean, maximum)
+        levels.append((mean, maximum))
+
+    # Nível 0 é o mais grosso
+    return levels[::-1]
+
+
+def save_pyramid(path, levels, bounds):
+    finest_mean, finest_max = levels[-1]
+    arrays = {'bounds': np.asarray(bounds, dtype=np.float64)}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        arrays['value_range'] = np.array([np.nanmin(finest_mean), np.nanmax(finest_max)], dtype=np.float64)
+    for zoom, (mean, maximum) in enumerate(levels):
+        arrays[f"mean_{zoom}"] = mean
+        arrays[f"max_{zoom}"] = maximum
+
+    # Sem compressão: cada nível fica como um .npy contíguo dentro do zip e pode ser mapeado em memória
+    with atomic_path(path, suffix='.npz') as tmp_path:
+        np.savez(tmp_path, **arrays)
+
+
+def build_pyramid_file(src, path):
+    levels = build_pyramid(src)
+    save_pyramid(path, levels, tuple(src.bounds))
+    return path
+
+
+def _map_member(path, f, info):
+    # Membro .npy sem compressão: pula o cabeçalho local do zip e o do .npy e mapeia os dados (mmap_mode='r')
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"{path}: {info.filename} is compressed and cannot be memory-mapped")
+    f.seek(info.header_offset)
+    name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+    f.seek(info.header_offset + 30 + name_length + extra_length)
+    major, _ = np.lib.format.read_magic(f)
+    read_header = np.lib.format.read_array_header_1_0 if major == 1 else np.lib.format.read_array_header_2_0
+    shape, fortran_order, dtype = read_header(f)
+    return np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+@lru_cache(maxsize=PYRAMID_CACHE_SIZE)
+def _load_pyramid(path, mtime):
+    # Os níveis são mapeados, não copiados: todos os workers compartilham as mesmas páginas do arquivo
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        members = {os.path.splitext(info.filename)[0]: info for info in archive.infolist()}
+        n_levels = sum(1 for key in members if key.startswith('mean_'))
+        arrays = {key: _map_member(path, f, info) for key, info in members.items()}
+    return {
+        'bounds': tuple(float(value) for value in arrays['bounds']),
+        'value_range': tuple(float(value) for value in arrays['value_range']),
+        'levels': [(arrays[f"mean_{zoom}"], arrays[f"max_{zoom}"]) for zoom in range(n_levels)],
+    }
+
+
+def load_pyramid(path):
+    return _load_pyramid(path, os.path.getmtime(path))
+
+
+def _cell_range(start, stop, origin, step, size):
+    # Tolerância para bordas que caem exatamente em limites de célula
+    first = int(np.floor((start - origin) / step + 1e-9))
+    last = int(np.ceil((stop - origin) / step - 1e-9))
+    return max(first, 0), min(last, size)
+
+
+def _window(level_shape, bounds, bbox):
+    west, south, east, north = bounds
+    height, width = level_shape
+    cell_width = (east - west) / width
+    cell_height = (north - south) / height
+    col_start, col_stop = _cell_range(bbox[0], bbox[2], west, cell_width, width)
+    row_start, row_stop = _cell_range(north - bbox[3], north - bbox[1], 0, cell_height, height)
+    return row_start, row_stop, col_start, col_stop, cell_width, cell_height
+
+
+def _split_bbox(bbox):
+    # Bounding boxes que cruzam o antimeridiano viram duas
+    west, south, east, north = bbox
+    if west <= east:
+        return [bbox]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+
+def query_pyramid(pyramid, bbox=None, zoom=0, max_cells=PYRAMID_MAX_CELLS):
+    bounds = pyramid['bounds']
+    levels = pyramid['levels']
+    boxes = _split_bbox(bbox) if bbox is not None else [bounds]
+
+    # Usa o nível pedido, descendo de nível enquanto a janela tiver células demais
+    zoom = int(np.clip(zoom, 0, len(levels) - 1))
+    while True:
+        windows = [_window(levels[zoom][0].shape, bounds, box) for box in boxes]
+        n_cells = sum(max(r1 - r0, 0) * max(c1 - c0, 0) for r0, r1, c0, c1, _, _ in windows)
+        if n_cells <= max_cells or zoom == 0:
+            break
+        zoom -= 1
+
+    mean, maximum = levels[zoom]
+    data_min, data_max = pyramid['value_range']
+    scale = (data_max - data_min) or 1.0
+    lats, lons, values, maxima = [], [], [], []
+    for row_start, row_stop, col_start, col_stop, cell_width, cell_height in windows:
+        window_mean = mean[row_start:row_stop, col_start:col_stop]
+        rows, cols = np.nonzero(~np.isnan(window_mean))
+        lats.append(bounds[3] - (row_start + rows + 0.5) * cell_height)
+        lons.append(bounds[0] + (col_start + cols + 0.5) * cell_width)
+        values.append((window_mean[rows, cols] - data_min) / scale)
+        maxima.append((maximum[row_start:row_stop, col_start:col_stop][rows, cols] - data_min) / scale)
+
+    return {
+        'zoom': zoom,
+        'lats': np.concatenate(lats),
+        'lons': np.concatenate(lons),
+        'values': np.clip(np.concatenate(values), 0, 1),
+        'max': np.clip(np.concatenate(maxima), 0, 1),
+    }
+
+
+def cells_to_points(cells):
+    return [
+        {'lat': lat, 'lon': lon, 'value': value, 'max': maximum}
+        for lat, lon, value, maximum in zip(cells['lats'].tolist(), cells['lons'].tolist(),
+                                            cells['values'].tolist(), cells['max'].tolist())
+    ]
@@ -2,6 +2,15 @@ import os
 import pandas as pd
 import unicodedata
 import re
+from concurrent.futures import ThreadPoolExecutor
+from us_ghg_center.artifact_cache import ARTIFACT_CACHE
+
+CACHE_FOLDER_NAME = 'cache'  # Pasta (ao lado da pasta dos CSVs) com um Parquet por CSV já processado
+CSV_CACHE_VERSION = 1  # Aumente ao mudar o parse: invalida os Parquets em cache
+MAX_WORKERS = min(8, os.cpu_count() or 1)  # CSVs lidos ao mesmo tempo
+MONTHS = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho',
+          'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro', 'Total']
+COLUMNS = ['state', 'state_normalized', 'month', 'fire_count', 'year']
 
 
 def normalize_state_name(name):
@@ -32,26 +41,59 @@ def format_state_name(name):
     return formatted_name
 
 
-def load_and_preprocess_data(csv_folder):
-    state_files = [f for f in os.listdir(csv_folder) if f.startswith('historico_estado_') and f.endswith('.csv')]
+def _parse_state_csv(csv_path):
+    state_name = os.path.basename(csv_path).split('_', 2)[-1].replace('.csv', '')
+    df = pd.read_csv(csv_path, index_col=0)
+    df['state'] = format_state_name(state_name)
+    df['state_normalized'] = normalize_state_name(state_name)
+    df = df.reset_index()
+
+    df = df[~df['index'].isin(['Máximo*', 'Média*', 'Mínimo*'])]
+
+    df = df.melt(id_vars=['index', 'state', 'state_normalized'], var_name='month', value_name='fire_count')
+    df['year'] = df['index'].astype(int)
+    df['fire_count'] = pd.to_numeric(df['fire_count'], errors='coerce')
+    return _apply_dtypes(df.drop(columns='index'))
+
+
+def _apply_dtypes(df):
+    # Tipos explícitos: categorias para estado e mês, inteiros pequenos para ano e contagem (meses vazios ficam <NA>)
+    months = MONTHS + sorted(set(df['month'].astype(str)) - set(MONTHS))
+    return df.astype({
+        'state': 'category',
+        'state_normalized': 'category',
+        'month': pd.CategoricalDtype(months),
+        'year': 'int16',
+        'fire_count': 'Int32',
+    })[COLUMNS]
 
-    dfs = []
-    for state_file in state_files:
+
+def _load_state_csv(csv_path, cache_folder):
+    # Parquet por CSV no cache de artefatos: só é refeito quando o conteúdo do CSV muda
+    parquet_path = os.path.join(cache_folder, os.path.basename(csv_path).replace('.csv', '.parquet'))
+    ARTIFACT_CACHE.get_or_create(
+        'wildfire_csv', {os.path.basename(parquet_path): parquet_path},
+        lambda: _parse_state_csv(csv_path).to_parquet(parquet_path, index=False),
+        inputs=[csv_path], params={'columns': COLUMNS}, version=CSV_CACHE_VERSION)
+    return pd.read_parquet(parquet_path)
+
+
+def load_and_preprocess_data(csv_folder, cache_folder=None, max_workers=MAX_WORKERS):
+    if cache_folder is None:
+        cache_folder = os.path.join(os.path.dirname(os.path.abspath(csv_folder)), CACHE_FOLDER_NAME)
+    os.makedirs(cache_folder, exist_ok=True)
+    state_files = sorted(f for f in os.listdir(csv_folder) if f.startswith('historico_estado_') and f.endswith('.csv'))
+
+    def load(state_file):
         try:
-            df = pd.read_csv(os.path.join(csv_folder, state_file), index_col=0)
-            state_name = state_file.split('_', 2)[-1].replace('.csv', '')
-            df['state'] = format_state_name(state_name)
-            df['state_normalized'] = normalize_state_name(state_name)
-            df = df.reset_index()
-
-            df = df[~df['index'].isin(['Máximo*', 'Média*', 'Mínimo*'])]
-
-            df = df.melt(id_vars=['index', 'state', 'state_normalized'], var_name='month', value_name='fire_count')
-            df['year'] = df['index'].astype(int)
-            df['fire_count'] = pd.to_numeric(df['fire_count'], errors='coerce')
-            dfs.append(df)
+            return _load_state_csv(os.path.join(csv_folder, state_file), cache_folder)
         except Exception as e:
             print(f"Erro ao carregar {state_file}: {e}")
+            return None
+
+    # Arquivos independentes são lidos em paralelo
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dfs = [df for df in executor.map(load, state_files) if df is not None]
 
     full_data = pd.concat(dfs, ignore_index=True)
-    return full_data
\ No newline at end of file
+    return _apply_dtypes(full_data)
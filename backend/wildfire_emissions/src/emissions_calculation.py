@@ -1,3 +1,6 @@
-def calculate_emissions(data, emission_factor=0.021):
+DEFAULT_EMISSION_FACTOR = 0.021  # Emissão de carbono (ton) por foco de queimada
+
+
+def calculate_emissions(data, emission_factor=DEFAULT_EMISSION_FACTOR):
     data['carbon_emission'] = data['fire_count'] * emission_factor
-    return data
\ No newline at end of file
+    return data
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from .data_processing import MONTHS, normalize_state_name
+
+
+class FireCube:
+    """Cubo denso (estado, ano, mês) -> focos e emissão de carbono, montado a partir dos registros de plot_data."""
+
+    def __init__(self, plot_data, version=None):
+        # version: identifica o conteúdo de plot_data (igual em todos os workers), usado nas chaves de cache das respostas
+        self.version = version
+        df = pd.DataFrame(plot_data)
+        year_month = df['year_month'].str.split('-', n=1, expand=True)
+        years = year_month[0].astype(int).to_numpy()
+        months = year_month[1]
+
+        # Estados na ordem em que aparecem; meses na ordem do calendário (e 'Total', o total anual do INPE, no fim)
+        self.states = list(pd.unique(df['state']))
+        self.years = sorted(set(years.tolist()))
+        self.months = [month for month in MONTHS if month in set(months)] + sorted(set(months) - set(MONTHS))
+        self._state_index = {normalize_state_name(state): i for i, state in enumerate(self.states)}
+        self._month_index = {normalize_state_name(month): i for i, month in enumerate(self.months)}
+
+        s = pd.Categorical(df['state'], categories=self.states).codes
+        y = np.searchsorted(self.years, years)
+        m = pd.Categorical(months, categories=self.months).codes
+        shape = (len(self.states), len(self.years), len(self.months))
+        self.fire_count = np.zeros(shape, dtype=np.int32)
+        self.carbon_emission = np.zeros(shape, dtype=np.float64)
+        self.present = np.zeros(shape, dtype=bool)
+        self.fire_count[s, y, m] = df['fire_count'].to_numpy()
+        self.carbon_emission[s, y, m] = df['carbon_emission'].to_numpy()
+        self.present[s, y, m] = True
+
+        coordinates = df.groupby('state', sort=False)[['latitude', 'longitude']].first().reindex(self.states)
+        self.latitudes = coordinates['latitude'].tolist()
+        self.longitudes = coordinates['longitude'].tolist()
+
+    def state_index(self, state):
+        index = self._state_index.get(normalize_state_name(state))
+        if index is None:
+            raise KeyError(f"Unknown state {state}")
+        return index
+
+    def year_index(self, year):
+        try:
+            return self.years.index(int(year))
+        except ValueError:
+            raise KeyError(f"No wildfire data for year {year}")
+
+    def month_index(self, month):
+        # Aceita o nome em português (com ou sem acento) ou o número do mês
+        if str(month).isdigit() and 1 <= int(month) <= 12:
+            month = MONTHS[int(month) - 1]
+        index = self._month_index.get(normalize_state_name(str(month)))
+        if index is None:
+            raise KeyError(f"Unknown month {month}")
+        return index
+
+    def selection(self, year=None, month=None, state=None):
+        states = [self.state_index(state)] if state is not None else slice(None)
+        years = [self.year_index(year)] if year is not None else slice(None)
+        months = [self.month_index(month)] if month is not None else slice(None)
+        return states, years, months
+
+    def records(self, year=None, month=None, state=None):
+        # Mesmo formato (e mesma ordem: estado, mês, ano) dos registros de plot_data
+        states, years, months = self.selection(year, month, state)
+        state_ids = np.arange(len(self.states))[states]
+        year_ids = np.arange(len(self.years))[years]
+        month_ids = np.arange(len(self.months))[months]
+        present = self.present[np.ix_(state_ids, year_ids, month_ids)].transpose(0, 2, 1)
+        s, m, y = np.nonzero(present)
+        s, m, y = state_ids[s], month_ids[m], year_ids[y]
+        return [
+            {
+                'year_month': f"{self.years[yi]}-{self.months[mi]}",
+                'state': self.states[si],
+                'latitude': self.latitudes[si],
+                'longitude': self.longitudes[si],
+                'fire_count': fire_count,
+                'carbon_emission': carbon_emission,
+            }
+            for si, mi, yi, fire_count, carbon_emission in zip(
+                s.tolist(), m.tolist(), y.tolist(),
+                self.fire_count[s, y, m].tolist(), self.carbon_emission[s, y, m].tolist())
+        ]
+
+    def totals(self, year=None, month=None, state=None):
+        # Soma por estado; sem mês escolhido, a coluna 'Total' fica de fora para não contar o ano duas vezes
+        states, years, months = self.selection(year, month, state)
+        if month is None and 'Total' in self.months:
+            months = [i for i, name in enumerate(self.months) if name != 'Total']
+        state_ids = np.arange(len(self.states))[states]
+        fire_count = self.fire_count[states][:, years][:, :, months].sum(axis=(1, 2))
+        carbon_emission = self.carbon_emission[states][:, years][:, :, months].sum(axis=(1, 2))
+        return [
+            {
+                'state': self.states[si],
+                'latitude': self.latitudes[si],
+                'longitude': self.longitudes[si],
+                'fire_count': count,
+                'carbon_emission': emission,
+            }
+            for si, count, emission in zip(state_ids.tolist(), fire_count.tolist(), carbon_emission.tolist())
+        ]
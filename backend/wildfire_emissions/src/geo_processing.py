@@ -1,8 +1,19 @@
-import geopandas as gpd
-from .data_processing import normalize_state_name
+import glob
+import json
+import os
+import pandas as pd
+from .data_processing import CACHE_FOLDER_NAME, normalize_state_name
+from us_ghg_center.artifact_cache import ARTIFACT_CACHE
+from us_ghg_center.atomic_file import atomic_open
+
+STATE_CENTROIDS_NAME = 'state_centroids.json'  # Tabela (estado, lat, lon) guardada na pasta de cache
+STATE_CENTROIDS_VERSION = 1  # Aumente ao mudar o cálculo dos centroides: invalida a tabela em cache
+CENTROID_COLUMNS = ['state', 'state_normalized', 'latitude', 'longitude']
 
 
 def load_and_process_shapefile(shapefile_path):
+    # geopandas (e shapely/pyproj) só são importados quando a tabela de centroides precisa ser refeita
+    import geopandas as gpd
     br_states = gpd.read_file(shapefile_path)
 
     # Assumindo que o nome da coluna com os nomes dos estados é 'NM_UF'
@@ -18,4 +29,41 @@ def load_and_process_shapefile(shapefile_path):
     br_states['longitude'] = centroids.x
     br_states['latitude'] = centroids.y
 
-    return br_states
\ No newline at end of file
+    return br_states
+
+
+def shapefile_inputs(shapefile_path):
+    # .shp e arquivos auxiliares (nomes no .dbf, projeção no .prj): todos entram na chave da tabela
+    return sorted(glob.glob(f"{os.path.splitext(shapefile_path)[0]}.*"))
+
+
+def _write_state_centroids(shapefile_path, table_path):
+    br_states = load_and_process_shapefile(shapefile_path)
+    # JSON com floats do Python: as coordenadas voltam idênticas (to_json arredonda para 15 dígitos)
+    records = [dict(zip(CENTROID_COLUMNS, row)) for row in
+               zip(*(br_states[column].tolist() for column in CENTROID_COLUMNS))]
+    with atomic_open(table_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+
+
+def load_state_centroids(shapefile_path, cache_folder=None):
+    """Tabela (estado, estado normalizado, latitude, longitude), gerada uma vez por versão do shapefile."""
+    if cache_folder is None:
+        cache_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(shapefile_path))), CACHE_FOLDER_NAME)
+    os.makedirs(cache_folder, exist_ok=True)
+    table_path = os.path.join(cache_folder, STATE_CENTROIDS_NAME)
+
+    if os.path.exists(shapefile_path):
+        ARTIFACT_CACHE.get_or_create(
+            'state_centroids', {STATE_CENTROIDS_NAME: table_path},
+            lambda: _write_state_centroids(shapefile_path, table_path),
+            inputs=shapefile_inputs(shapefile_path), params={'columns': CENTROID_COLUMNS},
+            version=STATE_CENTROIDS_VERSION)
+    elif os.path.exists(table_path):
+        # Sem o shapefile (ex.: implantação só com a tabela), usa a última tabela gerada
+        print(f"Shapefile '{shapefile_path}' não encontrado; usando '{table_path}'")
+    else:
+        raise FileNotFoundError(f"Shapefile '{shapefile_path}' not found and no cached state centroids")
+
+    with open(table_path, 'r', encoding='utf-8') as f:
+        return pd.DataFrame(json.load(f), columns=CENTROID_COLUMNS)
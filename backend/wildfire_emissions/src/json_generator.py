@@ -1,27 +1,31 @@
 import json
-import numpy as np
+from us_ghg_center.atomic_file import atomic_open
 
 
 def generate_plot_data(full_data, br_states):
-    plot_data = []
+    # Um único merge com a tabela de centroides (primeira feição de cada estado), em vez de filtrar br_states por linha
+    centroids = br_states[['state_normalized', 'latitude', 'longitude']].drop_duplicates('state_normalized')
+    merged = full_data.merge(centroids, on='state_normalized', how='left', sort=False)
 
-    for _, row in full_data.iterrows():
-        state_geo = br_states[br_states['state_normalized'] == row['state_normalized']]
-        if not state_geo.empty:
-            plot_data.append({
-                'year_month': f"{row['year']}-{row['month']}",
-                'state': row['state'],
-                'latitude': float(state_geo.iloc[0]['latitude']),
-                'longitude': float(state_geo.iloc[0]['longitude']),
-                'fire_count': int(row['fire_count']) if not np.isnan(row['fire_count']) else 0,
-                'carbon_emission': float(row['carbon_emission']) if not np.isnan(row['carbon_emission']) else 0.0
-            })
-        else:
-            print(f"Estado não encontrado: {row['state']} (normalizado: {row['state_normalized']})")
+    matched = merged['latitude'].notna()
+    for state, state_normalized in merged.loc[~matched, ['state', 'state_normalized']].drop_duplicates().itertuples(index=False):
+        print(f"Estado não encontrado: {state} (normalizado: {state_normalized})")
+    merged = merged[matched]
 
-    return plot_data
+    # Colunas já convertidas; os registros saem de listas Python nativas (mais rápido que to_dict('records'))
+    columns = {
+        'year_month': (merged['year'].astype(str) + '-' + merged['month'].astype(str)).tolist(),
+        'state': merged['state'].tolist(),
+        'latitude': merged['latitude'].astype(float).tolist(),
+        'longitude': merged['longitude'].astype(float).tolist(),
+        'fire_count': merged['fire_count'].fillna(0).astype(int).tolist(),
+        'carbon_emission': merged['carbon_emission'].fillna(0.0).astype(float).tolist(),
+    }
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
 
 
 def save_json(data, filename):
-    with open(filename, 'w', encoding='utf-8') as f:
+    # Escreve em um temporário exclusivo e troca de uma vez: quem lê nunca vê o arquivo pela metade
+    with atomic_open(filename, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
@@ -0,0 +1,95 @@
+import numpy as np
+
+from .emissions_calculation import DEFAULT_EMISSION_FACTOR
+from .data_processing import normalize_state_name
+
+MAX_SCENARIOS = 10000  # Cenários por requisição
+GROUP_BY = {  # Eixos mantidos no resultado (s = cenário, q = estado, y = ano, m = mês)
+    'scenario': 's',
+    'state': 'sq',
+    'year': 'sy',
+    'month': 'sm',
+}
+
+
+class ScenarioEngine:
+    """Emissões de vários cenários de fatores (cenário x estado [x mês]) numa única operação sobre o cubo de focos."""
+
+    def __init__(self, cube):
+        # Só os meses (sem a coluna 'Total' do INPE); cópia feita uma vez, as varreduras só leem
+        monthly = [i for i, month in enumerate(cube.months) if month != 'Total']
+        self.states = list(cube.states)
+        self.years = list(cube.years)
+        self.months = [cube.months[i] for i in monthly]
+        self.counts = np.ascontiguousarray(cube.fire_count[:, :, monthly], dtype=np.float64)
+        self._state_index = {normalize_state_name(state): i for i, state in enumerate(self.states)}
+
+    def factor_matrix(self, factors, states=None, default_factor=DEFAULT_EMISSION_FACTOR):
+        """Fatores como array (cenário, estado, mês), sem cópia quando já vêm completos.
+
+        factors pode ser um número, (cenário,), (cenário, estado) ou (cenário, estado, mês). states escolhe
+        a ordem (e um subconjunto) das colunas de estado; os estados de fora usam default_factor.
+        """
+        factors = np.asarray(factors, dtype=np.float64)
+        if factors.ndim == 0:
+            factors = factors.reshape(1)
+        if factors.ndim > 3:
+            raise ValueError("factors must have at most 3 dimensions (scenario, state, month)")
+        if factors.shape[0] > MAX_SCENARIOS:
+            raise ValueError(f"At most {MAX_SCENARIOS} scenarios per sweep")
+        if not np.all(np.isfinite(factors)):
+            raise ValueError("factors must be finite numbers")
+
+        if factors.ndim == 1:
+            factors = factors[:, None, None]
+        elif factors.ndim == 2:
+            factors = factors[:, :, None]
+
+        if states is not None:
+            if factors.shape[1] != len(states):
+                raise ValueError(f"factors have {factors.shape[1]} state columns but {len(states)} states were given")
+            columns = [self.state_index(state) for state in states]
+            full = np.full((factors.shape[0], len(self.states), factors.shape[2]), default_factor, dtype=np.float64)
+            full[:, columns] = factors
+            factors = full
+        elif factors.shape[1] not in (1, len(self.states)):
+            raise ValueError(f"Expected {len(self.states)} state columns, got {factors.shape[1]}")
+
+        if factors.shape[2] not in (1, len(self.months)):
+            raise ValueError(f"Expected {len(self.months)} month columns, got {factors.shape[2]}")
+        # Eixos de tamanho 1 viram views com stride 0
+        return np.broadcast_to(factors, (factors.shape[0], len(self.states), len(self.months)))
+
+    def state_index(self, state):
+        index = self._state_index.get(normalize_state_name(state))
+        if index is None:
+            raise KeyError(f"Unknown state {state}")
+        return index
+
+    def year_index(self, year):
+        try:
+            return self.years.index(int(year))
+        except ValueError:
+            raise KeyError(f"No wildfire data for year {year}")
+
+    def totals(self, factors, by='scenario', year=None, states=None, default_factor=DEFAULT_EMISSION_FACTOR):
+        """Emissão total de cada cenário, agrupada por 'scenario', 'state', 'year' ou 'month'."""
+        if by not in GROUP_BY:
+            raise ValueError(f"by must be one of {', '.join(GROUP_BY)}")
+        factors = self.factor_matrix(factors, states, default_factor)
+        counts = self.counts
+        if year is not None:
+            index = self.year_index(year)
+            counts = counts[:, index:index + 1]  # Fatia (view), sem cópia
+        # Um único einsum: soma de fator[s, q, m] * focos[q, y, m] sem materializar (cenário x estado x ano x mês)
+        return np.einsum(f"sqm,qym->{GROUP_BY[by]}", factors, counts, optimize=True)
+
+    def axis(self, by, year=None):
+        # Rótulos do segundo eixo do resultado
+        if by == 'state':
+            return self.states
+        if by == 'year':
+            return self.years if year is None else [self.years[self.year_index(year)]]
+        if by == 'month':
+            return self.months
+        return None
@@ -1,14 +1,122 @@
+from functools import lru_cache
+
 import plotly.graph_objects as go
-import pandas as pd
-import plotly.express as px
 import numpy as np
-from dash import Dash, dcc, html, Input, Output
+from dash import Dash, dcc, html, Input, Output, Patch
+
+from .fire_cube import FireCube
+
+FIGURE_CACHE_SIZE = 64  # Figuras e marcadores (ano, mês) guardados em memória
+SIZE_MAX = 30  # Diâmetro máximo dos pontos
+COLOR_SCALE = ["yellow", "orange", "red", "darkred"]
+MAP_CENTER = {"lat": -14.2350, "lon": -51.9253}
+
+
+class FireMapData:
+    """Quadro tipado montado uma vez por app: focos e emissões por estado para cada (ano, mês), com 'Total' e 'Todos' já agregados."""
+
+    def __init__(self, data):
+        cube = data if isinstance(data, FireCube) else FireCube(data)
+        self.states = np.array(cube.states, dtype=object)
+        self.latitudes = np.array(cube.latitudes, dtype=np.float64)
+        self.longitudes = np.array(cube.longitudes, dtype=np.float64)
+        self.years = [str(year) for year in cube.years]
+        self.months = list(cube.months)
+
+        # 'Todos' soma os meses sem a coluna 'Total' do INPE (que já é o total do ano); o ano 'Total' soma todos os anos
+        monthly = [i for i, month in enumerate(cube.months) if month != 'Total']
+
+        def aggregate(values, combine):
+            values = np.concatenate([combine(values[:, :, monthly], axis=2, keepdims=True), values], axis=2)
+            return np.concatenate([combine(values, axis=1, keepdims=True), values], axis=1)
+
+        # Eixos: (estado, ['Total'] + anos, ['Todos'] + meses)
+        self._year_index = {year: i for i, year in enumerate(['Total'] + self.years)}
+        self._month_index = {month: i for i, month in enumerate(['Todos'] + self.months)}
+        self.fire_count = aggregate(cube.fire_count.astype(np.int64), np.sum)
+        self.carbon_emission = aggregate(cube.carbon_emission, np.sum)
+        self.present = aggregate(cube.present, np.any)
+
+        # Cache por instância: cada app tem os seus dados
+        self.markers = lru_cache(maxsize=FIGURE_CACHE_SIZE)(self._markers)
+        self.figure = lru_cache(maxsize=FIGURE_CACHE_SIZE)(self._figure)
+
+    def _markers(self, year='Total', month='Todos'):
+        # Colunas dos pontos de um (ano, mês); listas vazias quando não há dados
+        y = self._year_index.get(str(year))
+        m = self._month_index.get(month)
+        if y is None or m is None or not self.present[:, y, m].any():
+            print(f"Não há dados para o ano {year} e mês {month}")
+            return {'lat': [], 'lon': [], 'state': [], 'fire_count': [], 'carbon_emission': [], 'size': []}
+
+        states = np.flatnonzero(self.present[:, y, m])
+        fire_count = self.fire_count[states, y, m]
+        carbon_emission = np.rint(self.carbon_emission[states, y, m]).astype(np.int64)
+
+        # Normalizar o tamanho dos pontos
+        max_count = fire_count.max()
+        size = np.sqrt(fire_count) / np.sqrt(max_count) * SIZE_MAX if max_count > 0 else np.zeros(len(states))
+        return {
+            'lat': self.latitudes[states].tolist(),
+            'lon': self.longitudes[states].tolist(),
+            'state': self.states[states].tolist(),
+            'fire_count': fire_count.tolist(),
+            'carbon_emission': carbon_emission.tolist(),
+            'size': size.tolist(),
+        }
+
+    def _figure(self, year='Total', month='Todos'):
+        markers = self.markers(year, month)
+        fig = go.Figure(go.Scattermapbox(
+            lat=markers['lat'],
+            lon=markers['lon'],
+            mode='markers',
+            marker=dict(
+                color=markers['fire_count'],
+                size=markers['size'],
+                # Tamanhos já normalizados até SIZE_MAX: mesma escala que o px.scatter_mapbox usava
+                sizemode='area',
+                sizeref=1 / SIZE_MAX,
+                coloraxis='coloraxis',
+                opacity=0.8,
+            ),
+            hovertext=markers['state'],
+            customdata=list(zip(markers['fire_count'], markers['carbon_emission'])),
+            hovertemplate="<b>%{hovertext}</b><br><br>" +
+                          "Fire Outbreaks: %{marker.color}<br>" +
+                          "Carbon Emission: %{customdata[1]} ton<br>" +
+                          "<extra></extra>",
+        ))
+
+        fig.update_layout(
+            mapbox=dict(style="carto-darkmatter", zoom=3, center=MAP_CENTER),
+            coloraxis=dict(colorscale=COLOR_SCALE, colorbar_title="Fire Count"),
+            title=map_title(year, month),
+            height=800,
+            width=1200,
+        )
+        return fig
+
+    def patch(self, year='Total', month='Todos'):
+        # Atualização parcial: só os dados dos pontos e o título vão para o navegador
+        markers = self.markers(year, month)
+        patch = Patch()
+        patch['data'][0]['lat'] = markers['lat']
+        patch['data'][0]['lon'] = markers['lon']
+        patch['data'][0]['hovertext'] = markers['state']
+        patch['data'][0]['customdata'] = list(zip(markers['fire_count'], markers['carbon_emission']))
+        patch['data'][0]['marker']['color'] = markers['fire_count']
+        patch['data'][0]['marker']['size'] = markers['size']
+        patch['layout']['title']['text'] = map_title(year, month)
+        return patch
 
 
 def create_fire_map_app(data):
     app = Dash(__name__)
 
-    years, months = get_available_years_and_months(data)
+    # Dados agregados uma única vez; os callbacks só consultam
+    map_data = data if isinstance(data, FireMapData) else FireMapData(data)
+    years, months = get_available_years_and_months(map_data)
 
     # Ordenar os anos do mais recente para o mais antigo
     years = sorted(years, reverse=True)
@@ -28,92 +136,37 @@ def create_fire_map_app(data):
         dcc.Dropdown(id='year-dropdown', options=years, value='Total', clearable=False),
         dcc.Dropdown(id='month-dropdown', options=months_english, value='All', clearable=False),
         html.Button('Update Map', id='update-button', n_clicks=0),
-        dcc.Graph(id='fire-map')
+        dcc.Graph(id='fire-map', figure=map_data.figure('Total', 'Todos'))
     ])
 
+    # A figura inicial já vem no layout; mudanças nos filtros enviam só um Patch
     @app.callback(
         Output('fire-map', 'figure'),
         Input('update-button', 'n_clicks'),
         Input('year-dropdown', 'value'),
-        Input('month-dropdown', 'value')
+        Input('month-dropdown', 'value'),
+        prevent_initial_call=True
     )
     def update_map(n_clicks, year, month):
         month_portuguese = month_to_portuguese(month)
-        return plot_fire_map(data, year, month_portuguese)
+        return map_data.patch(year, month_portuguese)
 
     return app
 
 
 def plot_fire_map(data, year='Total', month='Todos'):
-    df = pd.DataFrame(data)
-    df['year'] = df['year_month'].str.split('-').str[0]
-    df['month'] = df['year_month'].str.split('-').str[1]
-
-    if year == 'Total':
-        # Agregar dados para o total
-        df = df.groupby(['state', 'latitude', 'longitude']).agg({
-            'fire_count': 'sum',
-            'carbon_emission': 'sum'
-        }).reset_index()
-    else:
-        df = df[df['year'] == year]
-
-    if month != 'Todos':
-        df = df[df['month'] == month]
-
-    if df.empty:
-        print(f"Não há dados para o ano {year} e mês {month}")
-        return go.Figure()  # Return an empty figure
-
-    # Normalizar o tamanho dos pontos
-    df['normalized_size'] = np.sqrt(df['fire_count']) / np.sqrt(df['fire_count'].max()) * 30
-
-    # Arredondar as emissões de carbono para o inteiro mais próximo
-    df['carbon_emission_rounded'] = df['carbon_emission'].round().astype(int)
-
-    fig = px.scatter_mapbox(df,
-                            lat="latitude",
-                            lon="longitude",
-                            color="fire_count",
-                            size="normalized_size",
-                            hover_name="state",
-                            hover_data={
-                                "fire_count": True,
-                                "carbon_emission_rounded": True,
-                                "latitude": False,
-                                "longitude": False,
-                                "normalized_size": False
-                            },
-                            color_continuous_scale=["yellow", "orange", "red", "darkred"],
-                            size_max=30,
-                            zoom=3,
-                            center={"lat": -14.2350, "lon": -51.9253},
-                            opacity=0.8)
-
-    fig.update_layout(
-        mapbox_style="carto-darkmatter",
-        title=f'Fire Outbreaks in Brazil ({year}, {month_to_english(month)})',
-        height=800,
-        width=1200,
-    )
+    # A figura vem do cache: copie (go.Figure(fig)) antes de alterá-la
+    map_data = data if isinstance(data, FireMapData) else FireMapData(data)
+    return map_data.figure(str(year), month)
 
-    fig.update_coloraxes(colorbar_title="Fire Count")
 
-    fig.update_traces(
-        hovertemplate="<b>%{hovertext}</b><br><br>" +
-                      "Fire Outbreaks: %{marker.color}<br>" +
-                      "Carbon Emission: %{customdata[1]} ton<br>" +
-                      "<extra></extra>"
-    )
-
-    return fig
+def map_title(year, month):
+    return f'Fire Outbreaks in Brazil ({year}, {month_to_english(month)})'
 
 
 def get_available_years_and_months(data):
-    df = pd.DataFrame(data)
-    years = sorted(df['year_month'].str.split('-').str[0].unique())
-    months = sorted(df['year_month'].str.split('-').str[1].unique())
-    return years, months
+    map_data = data if isinstance(data, FireMapData) else FireMapData(data)
+    return list(map_data.years), sorted(map_data.months)
 
 
 def month_to_english(month):
@@ -135,4 +188,4 @@ def month_to_portuguese(month):
         'October': 'Outubro', 'November': 'Novembro', 'December': 'Dezembro',
         'All': 'Todos'
     }
-    return months.get(month, month)
\ No newline at end of file
+    return months.get(month, month)